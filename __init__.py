@@ -21,5 +21,7 @@ else:
 	from .nodes.workflows import NODE_CLASS_MAPPINGS as WrkNodes
 	NODE_CLASS_MAPPINGS.update(WrkNodes)
 
+	from .core import routes
+
 	NODE_DISPLAY_NAME_MAPPINGS = {k:v.TITLE for k,v in NODE_CLASS_MAPPINGS.items()}
 	__all__ = ['NODE_CLASS_MAPPINGS', 'NODE_DISPLAY_NAME_MAPPINGS']
@@ -0,0 +1,57 @@
+"""
+Compare the old torch.cat batch assembly in fetch_from_remote with the
+preallocated core/imageio.assemble_batch. Each run happens in a fresh
+process so peak RSS isn't shared between them.
+
+	python bench/bench_assemble.py [batch] [size]
+"""
+import os
+import sys
+import time
+import resource
+import subprocess
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def legacy(images):
+	import torch
+	# previous img_to_torch + torch.cat loop
+	tensors = [torch.from_numpy(np.array(i).astype(np.float32) / 255.0)[None,] for i in images]
+	out = tensors[0]
+	for i in tensors[1:]:
+		out = torch.cat((out, i))
+	return out
+
+def prealloc(images):
+	from core.imageio import assemble_batch
+	return assemble_batch(images)
+
+def run(method, batch, size):
+	import torch # keep import cost out of the timing
+	rng = np.random.default_rng(0)
+	images = [rng.integers(0, 255, (size, size, 3), dtype=np.uint8) for _ in range(batch)]
+	base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	start = time.perf_counter()
+	out = {"legacy": legacy, "prealloc": prealloc}[method](images)
+	took = time.perf_counter() - start
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	print(f"{method} {took} {(peak - base) / 1024} {float(out.sum())}")
+
+if __name__ == "__main__":
+	if len(sys.argv) > 1 and sys.argv[1] == "--run":
+		run(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+		sys.exit()
+
+	batch = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+	size = int(sys.argv[2]) if len(sys.argv) > 2 else 1024
+	print(f"batch={batch} size={size}x{size}")
+	results = {}
+	for method in ["legacy", "prealloc"]:
+		out = subprocess.run(
+			[sys.executable, __file__, "--run", method, str(batch), str(size)],
+			capture_output=True, text=True, check=True,
+		).stdout.split()
+		results[method] = out
+		print(f"{method:>9}: {float(out[1])*1000:8.1f}ms  peak +{float(out[2]):8.1f}MB")
+	assert abs(float(results["legacy"][3]) - float(results["prealloc"][3])) < 1e-2 * float(results["legacy"][3]), "output mismatch"
@@ -0,0 +1,66 @@
+"""
+Compare the old npz + pickle conditioning strings with the safetensors
+container in core/codec.py on T5-XXL sized conditionings (256 tokens x 4096
+plus a pooled output, positive and negative entry).
+
+	python bench/bench_conditioning.py [tokens] [repeat]
+"""
+import os
+import io
+import sys
+import time
+import base64
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+from core.codec import encode_conditioning, decode_conditioning
+
+def legacy_encode(conditioning):
+	# previous ConditioningToBase64.convert, first entry only
+	cond_data, cond_meta = conditioning[0]
+	buffer = io.BytesIO()
+	np.savez_compressed(buffer, **{
+		"cond_data": cond_data.cpu().numpy(),
+		"cond_meta": {k: v.cpu().numpy() if isinstance(v, torch.Tensor) else v for k, v in cond_meta.items()},
+	})
+	return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+def legacy_decode(text):
+	# previous ConditioningFromBase64.convert
+	loaded_data = np.load(io.BytesIO(base64.b64decode(text)), allow_pickle=True)
+	cond_data = torch.from_numpy(loaded_data["cond_data"])
+	cond_meta = {k: torch.from_numpy(v) if isinstance(v, np.ndarray) else v for k, v in loaded_data["cond_meta"].item().items()}
+	return [[cond_data, cond_meta]]
+
+def timed(fn, arg, repeat):
+	best = None
+	for _ in range(repeat):
+		start = time.perf_counter()
+		out = fn(arg)
+		took = time.perf_counter() - start
+		best = took if best is None else min(best, took)
+	return best, out
+
+if __name__ == "__main__":
+	tokens = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+	repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+	torch.manual_seed(0)
+	conditioning = [
+		[torch.randn(1, tokens, 4096), {"pooled_output": torch.randn(1, 768), "guidance": 3.5}]
+		for _ in range(2)
+	]
+
+	methods = [
+		("npz (1st entry)", legacy_encode, legacy_decode),
+		("safetensors fp32", encode_conditioning, decode_conditioning),
+		("safetensors fp16", lambda c: encode_conditioning(c, "fp16"), decode_conditioning),
+	]
+	print(f"{'method':>18} {'encode':>9} {'decode':>9} {'size':>10}")
+	for name, enc, dec in methods:
+		enc_time, text = timed(enc, conditioning, repeat)
+		dec_time, out = timed(dec, text, repeat)
+		assert torch.allclose(out[0][0], conditioning[0][0], atol=1e-2)
+		print(f"{name:>18} {enc_time*1000:>7.1f}ms {dec_time*1000:>7.1f}ms {len(text)/2**20:>8.2f}MB")
@@ -0,0 +1,43 @@
+"""
+Wall clock of encoding one batch sequentially (the old save loops) vs. on
+core/imageio's encode pool, for a few compression settings.
+
+	python bench/bench_encode.py [batch] [size]
+"""
+import os
+import sys
+import time
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.imageio import ENCODE_WORKERS, encode_image, parallel_map
+
+def make_images(batch, size):
+	# smooth gradients + noise, compresses roughly like a generated image
+	rng = np.random.default_rng(0)
+	y, x = np.mgrid[0:size, 0:size]
+	base = np.stack([x, y, x + y], axis=-1) * (255 / (2 * size))
+	return [
+		Image.fromarray(np.clip(base + rng.normal(0, 8, base.shape), 0, 255).astype(np.uint8))
+		for _ in range(batch)
+	]
+
+def timed(fn):
+	start = time.perf_counter()
+	out = fn()
+	return time.perf_counter() - start, out
+
+if __name__ == "__main__":
+	batch = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+	size = int(sys.argv[2]) if len(sys.argv) > 2 else 2048
+	images = make_images(batch, size)
+	print(f"batch {batch} at {size}x{size}, {ENCODE_WORKERS} encode workers")
+	print(f"{'format':>14} {'level':>5} {'sequential':>11} {'parallel':>9} {'speedup':>8} {'size':>9}")
+	for fmt, level in [("png", 0), ("png", 1), ("png", 4), ("png", 9), ("webp_lossless", 4)]:
+		encode = lambda img: encode_image(img, fmt, level)
+		seq, out = timed(lambda: [encode(img) for img in images])
+		par, _ = timed(lambda: parallel_map(encode, images))
+		mb = sum(len(x) for x in out) / 2**20
+		print(f"{fmt:>14} {level:>5} {seq:>10.2f}s {par:>8.2f}s {seq/par:>7.1f}x {mb:>7.1f}MB")
@@ -0,0 +1,76 @@
+"""
+Compare the old nested-scan node deletion from dispatch_to_remote with the
+reverse-index BFS in core/graph.py on synthetic API prompts.
+
+	python bench/bench_prune.py
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.graph import find_descendants
+
+def legacy_prune(prompt, roots):
+	# copy of the previous recursive_node_deletion
+	to_del = []
+	def recursive_node_deletion(start_node):
+		target_nodes = [start_node]
+		if start_node not in to_del:
+			to_del.append(start_node)
+		while len(target_nodes) > 0:
+			new_targets = []
+			for target in target_nodes:
+				for node in prompt.keys():
+					inputs = prompt[node].get("inputs")
+					if not inputs:
+						continue
+					for i in inputs.values():
+						if type(i) == list:
+							if len(i) > 0 and i[0] in to_del:
+								if node not in to_del:
+									to_del.append(node)
+									new_targets.append(node)
+			target_nodes += new_targets
+			target_nodes.remove(target)
+	for r in roots:
+		recursive_node_deletion(r)
+	return set(to_del)
+
+def make_prompt(n, sinks, seed=0):
+	"""Random DAG, each node links to up to 3 earlier ones. Every 'sinks'th node feeds a SaveImage/FetchRemote."""
+	rng = random.Random(seed)
+	prompt = {}
+	for i in range(n):
+		inputs = {"seed": i, "text": "a photo"}
+		for k in range(rng.randint(0, 3) if i else 0):
+			inputs[f"in{k}"] = [str(rng.randrange(i)), 0]
+		prompt[str(i)] = {"class_type": "KSampler", "inputs": inputs}
+	roots = []
+	for i in range(0, n, sinks):
+		node = str(n + len(roots))
+		prompt[node] = {"class_type": "SaveImage", "inputs": {"images": [str(i), 0]}}
+		roots.append(node)
+	# a few chains hanging off the sinks so the BFS has work to do
+	for r in roots[:10]:
+		prev = r
+		for j in range(20):
+			node = str(len(prompt))
+			prompt[node] = {"class_type": "ImageScale", "inputs": {"image": [prev, 0]}}
+			prev = node
+	return prompt, roots
+
+def timed(fn, *args):
+	start = time.perf_counter()
+	out = fn(*args)
+	return out, time.perf_counter() - start
+
+if __name__ == "__main__":
+	print(f"{'nodes':>7} {'roots':>6} {'legacy':>10} {'bfs':>10} {'speedup':>8}")
+	for n in [250, 500, 1000, 2000]:
+		prompt, roots = make_prompt(n, 25)
+		old, t_old = timed(legacy_prune, prompt, roots)
+		new, t_new = timed(find_descendants, prompt, roots)
+		assert old == new, "pruning result mismatch"
+		print(f"{len(prompt):>7} {len(roots):>6} {t_old*1000:>8.1f}ms {t_new*1000:>8.2f}ms {t_old/t_new:>7.0f}x")
@@ -0,0 +1,102 @@
+import os
+import time
+import threading
+
+from .session import http_get
+
+TTL = float(os.environ.get("NETDIST_CAPS_TTL", 300)) # seconds before a background refresh
+
+# cached part : remote endpoint
+ENDPOINTS = {
+	"system_stats" : "/system_stats",
+	"object_info"  : "/object_info",
+	"netdist"      : "/netdist/info",
+}
+OPTIONAL = ["netdist"] # cached as None if the remote doesn't have the route
+
+class RemoteCapabilities:
+	"""
+	Metadata about one remote, keyed by remote URL. Each part is fetched on
+	first use, then served from memory. Once older than TTL, the stale value
+	is still returned while a background thread refreshes it.
+	"""
+	def __init__(self, remote_url):
+		self.remote_url = remote_url
+		self.lock = threading.Lock()
+		self.parts = {} # part : (fetch time, data)
+		self.refreshing = set()
+
+	def fetch(self, part):
+		r = http_get(f"{self.remote_url}{ENDPOINTS[part]}")
+		if r.status_code in [404, 405] and part in OPTIONAL:
+			data = None
+		else:
+			r.raise_for_status()
+			data = r.json()
+		with self.lock:
+			self.parts[part] = (time.time(), data)
+		return data
+
+	def refresh(self, part):
+		try:
+			self.fetch(part)
+		except Exception as e:
+			print(f"NetDist: failed to refresh {part} for {self.remote_url}:\n", e)
+		finally:
+			with self.lock:
+				self.refreshing.discard(part)
+
+	def get(self, part):
+		with self.lock:
+			cached = self.parts.get(part)
+			if cached and time.time() - cached[0] > TTL and part not in self.refreshing:
+				self.refreshing.add(part)
+				threading.Thread(target=self.refresh, args=(part,), daemon=True).start()
+		if cached is None:
+			return self.fetch(part)
+		return cached[1]
+
+CAPABILITIES = {}
+CAPABILITIES_LOCK = threading.Lock()
+
+def get_capabilities(remote_url):
+	with CAPABILITIES_LOCK:
+		if remote_url not in CAPABILITIES:
+			CAPABILITIES[remote_url] = RemoteCapabilities(remote_url)
+		return CAPABILITIES[remote_url]
+
+def invalidate(remote_url=None):
+	"""Drop cached metadata for one remote, or all of them."""
+	with CAPABILITIES_LOCK:
+		if remote_url is None:
+			CAPABILITIES.clear()
+		else:
+			CAPABILITIES.pop(remote_url, None)
+
+def get_remote_os(remote_url):
+	data = get_capabilities(remote_url).get("system_stats")
+	return data["system"]["os"]
+
+def get_node_schemas(remote_url):
+	return get_capabilities(remote_url).get("object_info")
+
+def get_output_nodes(remote_url):
+	return [k for k, v in get_node_schemas(remote_url).items() if v.get("output_node")]
+
+def has_node(remote_url, class_type):
+	return class_type in get_node_schemas(remote_url)
+
+def has_netdist(remote_url):
+	"""Whether the remote has the NetDist API routes (i.e. this pack is installed there)"""
+	try:
+		return get_capabilities(remote_url).get("netdist") is not None
+	except Exception:
+		return False
+
+def has_netdist_route(remote_url, route):
+	"""Whether the remote's NetDist version has a specific route/feature"""
+	try:
+		info = get_capabilities(remote_url).get("netdist")
+	except Exception:
+		return False
+	return info is not None and route in info.get("routes", [])
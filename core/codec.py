@@ -0,0 +1,205 @@
+import io
+import json
+import lzma
+import zlib
+import base64
+import struct
+import torch
+import numpy as np
+import safetensors.torch
+
+# Compact latent format, as bytes:
+#   b"NDL1" | header size (>I) | JSON header | payload
+# The header holds dtype, shape and compression of the payload. As a string
+# it's just base64 of the above, so the header can be read by decoding only
+# the first few characters.
+LATENT_MAGIC = b"NDL1"
+NPY_MAGIC = b"\x93NUMPY" # legacy np.save strings
+
+PRECISIONS = {
+	"fp32": torch.float32,
+	"fp16": torch.float16,
+	"bf16": torch.bfloat16,
+}
+DTYPE_NAMES = {
+	torch.float32: "float32",
+	torch.float16: "float16",
+	torch.bfloat16: "bfloat16",
+}
+ZLIB_LEVEL = 1 # float data barely compresses better at higher levels
+
+COMPRESSORS = {
+	"none": lambda b: b,
+	"zlib": lambda b: zlib.compress(b, ZLIB_LEVEL),
+	"lzma": lambda b: lzma.compress(b),
+}
+DECOMPRESSORS = {
+	"none": lambda b: b,
+	"zlib": zlib.decompress,
+	"lzma": lzma.decompress,
+}
+
+def tensor_to_bytes(tensor, precision="fp32"):
+	"""Raw little-endian bytes of a tensor in the requested precision, + dtype name"""
+	tensor = tensor.detach().cpu().to(PRECISIONS[precision]).contiguous()
+	dtype = DTYPE_NAMES[tensor.dtype]
+	if tensor.dtype == torch.bfloat16:
+		tensor = tensor.view(torch.int16) # numpy has no bf16
+	return memoryview(tensor.numpy()).cast("B"), dtype
+
+def bytes_to_array(raw, dtype, shape):
+	"""Inverse of tensor_to_bytes, always returns a writable float32 array"""
+	if dtype == "bfloat16":
+		# bf16 is the upper half of a float32
+		arr = (np.frombuffer(raw, dtype=np.uint16).astype(np.uint32) << 16).view(np.float32)
+	else:
+		arr = np.frombuffer(raw, dtype=dtype).astype(np.float32)
+	return arr.reshape(shape)
+
+def encode_latent_bytes(latent, precision="fp32", compression="zlib"):
+	raw, dtype = tensor_to_bytes(latent, precision)
+	header = json.dumps({
+		"dtype": dtype,
+		"shape": list(latent.shape),
+		"compression": compression,
+	}).encode("utf-8")
+	return b"".join([LATENT_MAGIC, struct.pack(">I", len(header)), header, COMPRESSORS[compression](raw)])
+
+def read_latent_header(data):
+	"""Parse the header of compact latent bytes, returns (header, payload offset)"""
+	if data[:4] != LATENT_MAGIC:
+		raise ValueError("Not a compact latent")
+	size = struct.unpack(">I", data[4:8])[0]
+	header = json.loads(bytes(data[8:8+size]))
+	if header.get("dtype") not in DTYPE_NAMES.values() or header.get("compression") not in DECOMPRESSORS:
+		raise ValueError(f"Unsupported latent format {header}")
+	return header, 8+size
+
+def decode_latent_bytes(data):
+	header, offset = read_latent_header(data)
+	raw = DECOMPRESSORS[header["compression"]](memoryview(data)[offset:])
+	return torch.from_numpy(bytes_to_array(raw, header["dtype"], header["shape"]))
+
+def encode_latent(latent, precision="fp32", compression="zlib"):
+	return base64.b64encode(encode_latent_bytes(latent, precision, compression)).decode("utf-8")
+
+def peek_b64(text, size):
+	"""Decode just enough of a base64 string to get the first 'size' bytes"""
+	chars = -(-size // 3) * 4
+	return base64.b64decode(text[:chars])[:size]
+
+def decode_latent(text):
+	"""Decode a latent string, either compact or the legacy np.save format"""
+	data = base64.b64decode(text)
+	if data[:4] == LATENT_MAGIC:
+		return decode_latent_bytes(data)
+	return torch.from_numpy(np.load(io.BytesIO(data)))
+
+def validate_latent(text):
+	"""Cheap check that only looks at the header, returns an error string or True"""
+	if not text:
+		return "Base64 latent string is empty"
+	try:
+		if len(text) % 4 != 0:
+			raise ValueError("Truncated base64")
+		start = peek_b64(text, 8)
+		if start[:4] == LATENT_MAGIC:
+			size = struct.unpack(">I", start[4:8])[0]
+			read_latent_header(peek_b64(text, 8 + size))
+		elif start[:6] != NPY_MAGIC:
+			raise ValueError("Unknown latent format")
+	except Exception:
+		return "Invalid base64 latent string"
+	return True
+
+# Conditioning container, as bytes:
+#   b"NDCOND01" | safetensors file
+# Every entry's cond tensor and tensor metadata ("{i}.cond", "{i}.meta.{key}")
+# are stored as tensors, the JSON-able metadata goes in the safetensors header.
+# The 8 byte magic keeps the tensor data aligned for the zero-copy decoder.
+COND_MAGIC = b"NDCOND01"
+
+SAFETENSORS_DTYPES = {
+	"F64": torch.float64, "F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16,
+	"I64": torch.int64, "I32": torch.int32, "I16": torch.int16, "I8": torch.int8,
+	"U8": torch.uint8, "BOOL": torch.bool,
+}
+
+def dtype_name(dtype):
+	return str(dtype).replace("torch.", "")
+
+def encode_conditioning_bytes(conditioning, precision="fp32"):
+	tensors = {}
+	entries = []
+	for i, (cond, meta) in enumerate(conditioning):
+		entry = {"tensors": {}, "meta": {}}
+		items = [("cond", cond)] + [(f"meta.{k}", v) for k, v in meta.items() if isinstance(v, torch.Tensor)]
+		for name, value in items:
+			entry["tensors"][name] = dtype_name(value.dtype) # restored on decode
+			if value.is_floating_point():
+				value = value.to(PRECISIONS[precision])
+			tensors[f"{i}.{name}"] = value.detach().cpu().contiguous()
+		for k, v in meta.items():
+			if isinstance(v, torch.Tensor):
+				continue
+			try:
+				json.dumps(v)
+			except (TypeError, ValueError):
+				print(f"NetDist: can't serialize conditioning key '{k}' ({type(v).__name__}), skipping")
+				continue
+			entry["meta"][k] = v
+		entries.append(entry)
+	data = safetensors.torch.save(tensors, metadata={"entries": json.dumps(entries)})
+	return COND_MAGIC + data
+
+def load_safetensors_buffer(buf, offset=0):
+	"""
+	Parse safetensors data without copying, all tensors are views into 'buf',
+	which has to be writable (i.e. a bytearray) and outlives them.
+	"""
+	size = struct.unpack("<Q", buf[offset:offset+8])[0]
+	header = json.loads(bytes(buf[offset+8:offset+8+size]))
+	metadata = header.pop("__metadata__", None) or {}
+	start = offset + 8 + size
+	tensors = {}
+	for name, info in header.items():
+		dtype = SAFETENSORS_DTYPES[info["dtype"]]
+		begin, end = info["data_offsets"]
+		if begin == end:
+			tensors[name] = torch.empty(info["shape"], dtype=dtype)
+			continue
+		count = (end - begin) // torch.empty((), dtype=dtype).element_size()
+		tensors[name] = torch.frombuffer(buf, dtype=dtype, count=count, offset=start+begin).view(info["shape"])
+	return tensors, metadata
+
+def decode_conditioning_bytes(data):
+	buf = data if isinstance(data, bytearray) else bytearray(data)
+	if buf[:8] != COND_MAGIC:
+		raise ValueError("Not a NetDist conditioning")
+	tensors, metadata = load_safetensors_buffer(buf, len(COND_MAGIC))
+	conditioning = []
+	for i, entry in enumerate(json.loads(metadata["entries"])):
+		restored = {}
+		for name, dtype in entry["tensors"].items():
+			value = tensors[f"{i}.{name}"]
+			if dtype_name(value.dtype) != dtype:
+				value = value.to(getattr(torch, dtype))
+			restored[name] = value
+		meta = dict(entry["meta"])
+		meta.update({k[5:]: v for k, v in restored.items() if k.startswith("meta.")})
+		conditioning.append([restored["cond"], meta])
+	return conditioning
+
+def encode_conditioning(conditioning, precision="fp32"):
+	return base64.b64encode(encode_conditioning_bytes(conditioning, precision)).decode("utf-8")
+
+def decode_conditioning(text):
+	"""Decode a conditioning string, either the container or the legacy npz format"""
+	buf = bytearray(base64.b64decode(text)) # writable, shared by all decoded tensors
+	if buf[:8] == COND_MAGIC:
+		return decode_conditioning_bytes(buf)
+	# legacy: only the first entry, metadata as a pickled object array
+	loaded_data = np.load(io.BytesIO(buf), allow_pickle=True)
+	cond_data = torch.from_numpy(loaded_data['cond_data'])
+	cond_meta = {k: torch.from_numpy(v) if isinstance(v, np.ndarray) else v for k, v in loaded_data['cond_meta'].item().items()}
+	return [[cond_data, cond_meta]]
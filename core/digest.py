@@ -0,0 +1,90 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from .utils import get_cache_dir
+
+CHUNK_SIZE = 2**20
+DIGEST_LIMIT = 10000 # remembered files, least recently used are dropped
+
+# "full" hashes every byte. "sampled" only hashes the size and SAMPLE_COUNT
+# evenly spaced chunks for files above SAMPLE_THRESHOLD, which is enough to
+# notice a re-saved file but not a single flipped byte in the middle of it.
+DIGEST_MODE = os.environ.get("NETDIST_DIGEST_MODE", "full")
+SAMPLE_THRESHOLD = int(os.environ.get("NETDIST_DIGEST_SAMPLE_MB", 256)) * 2**20
+SAMPLE_COUNT = 16
+
+# "path|inode|size|mtime_ns|mode" : digest, a file is only hashed again once it
+# changed. Kept on disk so restarts don't have to re-read everything.
+DIGESTS = OrderedDict()
+DIGESTS_LOCK = threading.Lock()
+DIGESTS_LOADED = False
+
+def get_digest_file():
+	return os.path.join(get_cache_dir(), "digests.json")
+
+def load_digests():
+	global DIGESTS_LOADED
+	if DIGESTS_LOADED:
+		return
+	DIGESTS_LOADED = True
+	try:
+		with open(get_digest_file()) as f:
+			DIGESTS.update(json.load(f))
+	except (OSError, ValueError):
+		pass
+
+def save_digests():
+	path = get_digest_file()
+	tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+	try:
+		with open(tmp, "w") as f:
+			json.dump(DIGESTS, f)
+		os.replace(tmp, path)
+	except OSError as e:
+		print("NetDist: failed to save the digest cache:\n", e)
+
+def get_file_key(path, mode):
+	st = os.stat(path)
+	return f"{os.path.abspath(path)}|{st.st_ino}|{st.st_size}|{st.st_mtime_ns}|{mode}"
+
+def hash_file(path):
+	m = hashlib.sha256()
+	with open(path, "rb") as f:
+		for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+			m.update(chunk)
+	return m.hexdigest()
+
+def hash_file_sampled(path):
+	size = os.path.getsize(path)
+	if size <= SAMPLE_THRESHOLD:
+		return hash_file(path)
+	m = hashlib.sha256(str(size).encode("utf-8"))
+	step = (size - CHUNK_SIZE) // (SAMPLE_COUNT - 1)
+	with open(path, "rb") as f:
+		for k in range(SAMPLE_COUNT):
+			f.seek(k * step)
+			m.update(f.read(CHUNK_SIZE))
+	return f"sampled-{m.hexdigest()}"
+
+def file_digest(path, mode=None):
+	"""
+	sha256 of a file, cached by its (path, inode, size, mtime_ns) so unchanged
+	files are never read twice, not even across restarts.
+	"""
+	mode = mode or DIGEST_MODE
+	key = get_file_key(path, mode)
+	with DIGESTS_LOCK:
+		load_digests()
+		if key in DIGESTS:
+			DIGESTS.move_to_end(key)
+			return DIGESTS[key]
+	digest = hash_file_sampled(path) if mode == "sampled" else hash_file(path)
+	with DIGESTS_LOCK:
+		DIGESTS[key] = digest
+		while len(DIGESTS) > DIGEST_LIMIT:
+			DIGESTS.popitem(last=False)
+		save_digests()
+	return digest
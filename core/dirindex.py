@@ -0,0 +1,36 @@
+import os
+import time
+import threading
+
+# A directory listing is reused until the directory's mtime changes, which
+# happens whenever a file is added, removed or renamed in it. Listings taken
+# within RACY seconds of that mtime could have missed a file written in the
+# same tick, so those are re-scanned on the next call.
+RACY = 2.0
+
+INDEX = {} # (path, extensions) : (mtime_ns, scan time, sorted file names as a tuple)
+INDEX_LOCK = threading.Lock()
+
+def scan_files(path, exts=None):
+	with os.scandir(path) as it:
+		files = [e.name for e in it if e.is_file()]
+	if exts:
+		files = [f for f in files if f.lower().endswith(exts)]
+	return sorted(files)
+
+def list_files(path, exts=None):
+	"""
+	Sorted names of the files in a directory, optionally only those ending in
+	one of 'exts' (lowercase, case insensitive match).
+	"""
+	exts = tuple(exts) if exts else None
+	key = (os.path.abspath(path), exts)
+	mtime = os.stat(path).st_mtime_ns
+	with INDEX_LOCK:
+		cached = INDEX.get(key)
+	if cached and cached[0] == mtime and cached[1] - mtime / 1e9 > RACY:
+		return list(cached[2]) # callers may modify it
+	files = tuple(scan_files(path, exts))
+	with INDEX_LOCK:
+		INDEX[key] = (mtime, time.time(), files)
+	return list(files)
@@ -3,15 +3,61 @@ import time
 import json
 import torch
 import random
-import requests
+import threading
 import numpy as np
 from PIL import Image
 from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
 
-from .utils import clean_url, get_client_id
+from .utils import clean_url, get_client_id, register_job
+from .listener import get_listener
+from .session import http_get, http_post
+from .graph import find_descendants, diff_prompt, prompt_hash, result_key
+from .results import has_result
+from .capabilities import get_remote_os, has_netdist, has_netdist_route, invalidate
+
+DELTA_RATIO = 0.5 # send a patch only if it's smaller than this fraction of the base
+
+BASES = {} # remote_url : (hash, prompt, JSON size) of the last base stored there
+BASES_LOCK = threading.Lock()
+
+def post_json(url, data):
+	return http_post(url, data=json.dumps(data), headers={"Content-Type": "application/json"})
+
+def submit_to_remote(remote_url, data):
+	"""
+	POST to /netdist/submit. If the remote supports it, the prompt is sent as
+	a patch against the last full prompt it got from us, which is stored
+	there as a base. Falls back to a full submit (and new base) when the
+	patch isn't much smaller or the remote no longer has the base.
+	"""
+	url = f"{remote_url}/netdist/submit"
+	if not has_netdist_route(remote_url, "delta"):
+		return post_json(url, data)
+	prompt = data["prompt"]
+	with BASES_LOCK:
+		last = BASES.get(remote_url)
+	if last is not None:
+		patch = diff_prompt(last[1], prompt)
+		if len(json.dumps(patch)) < DELTA_RATIO * last[2]:
+			body = {k: v for k, v in data.items() if k != "prompt"}
+			ar = post_json(url, {**body, "base": last[0], "patch": patch, "hash": prompt_hash(prompt)})
+			if ar.status_code != 409:
+				return ar
+			# remote restarted, dropped the base or rebuilt a different prompt, send it again
+	ar = post_json(url, {**data, "save_base": True})
+	if ar.ok:
+		with BASES_LOCK:
+			BASES[remote_url] = (prompt_hash(prompt), prompt, len(json.dumps(prompt)))
+	return ar
 
 def clear_remote_queue(remote_url):
-	r = requests.get(f"{remote_url}/queue", timeout=4)
+	if has_netdist(remote_url):
+		r = http_post(f"{remote_url}/netdist/cancel", json={"client_id": get_client_id()})
+		r.raise_for_status()
+		return
+
+	r = http_get(f"{remote_url}/queue")
 	r.raise_for_status()
 	queue = r.json()
 
@@ -20,72 +66,37 @@ def clear_remote_queue(remote_url):
 	for k in queue.get("queue_pending", []):
 		if k[3].get("client_id") == client_id:
 			to_cancel.append(k[1]) # job UUID
-	r = requests.post(
+	r = http_post(
 		f"{remote_url}/queue",
-		json    = {"delete" : to_cancel},
-		timeout = 4,
+		json = {"delete" : to_cancel},
 	)
 	r.raise_for_status()
 
 	for k in queue.get("queue_running", []):
 		if k[3].get("client_id") == client_id:
-			r = requests.post(
+			r = http_post(
 				f"{remote_url}/interrupt",
-				json    = {},
-				timeout = 4,
+				json = {},
 			)
 			r.raise_for_status()
 			break
 
-def get_remote_os(remote_url):
-	url = f"{remote_url}/system_stats"
-	r = requests.get(url, timeout=4)
-	r.raise_for_status()
-	data = r.json()
-	return data["system"]["os"]
-
-def get_output_nodes(remote_url):
-	# I'm 90% sure this could just use the
-	# list from the host but better safe than sorry
-	url = f"{remote_url}/object_info"
-	r = requests.get(url, timeout=4)
-	r.raise_for_status()
-	data = r.json()
-	out = [k for k, v in data.items() if v.get("output_node")]
-	return out
-
-
-def dispatch_to_remote(remote_url, prompt, job_id=f"{get_client_id()}-unknown", remote_params=[], outputs="final_image"):
+def build_remote_prompt(remote_url, prompt, remote_params=[], outputs="final_image"):
+    """The pruned prompt that would be queued on the remote, nothing is sent yet"""
     ### PROMPT LOGIC ###
     prompt = deepcopy(prompt)
-    to_del = []
-    
-    def recursive_node_deletion(start_node):
-        target_nodes = [start_node]
-        if start_node not in to_del:
-            to_del.append(start_node)
-        while len(target_nodes) > 0:
-            new_targets = []
-            for target in target_nodes:
-                for node in prompt.keys():
-                    inputs = prompt[node].get("inputs")
-                    if not inputs:
-                        continue
-                    for i in inputs.values():
-                        if type(i) == list:
-                            if len(i) > 0 and i[0] in to_del:
-                                if node not in to_del:
-                                    to_del.append(node)
-                                    new_targets.append(node)
-            target_nodes += new_targets
-            target_nodes.remove(target)
 
     # find current node and disable all others
     output_src = None
     for i in prompt.keys():
         if prompt[i]["class_type"].startswith("RemoteQueue"):
-            if clean_url(prompt[i]["inputs"]["remote_url"]) == remote_url:
+            urls = clean_url(prompt[i]["inputs"]["remote_url"], multi=True)
+            if prompt[i]["class_type"] != "RemoteQueueFanout":
+                urls = urls[:1]
+            if remote_url in urls:
                 prompt[i]["inputs"]["enabled"] = "remote"
+                if prompt[i]["class_type"] == "RemoteQueueFanout":
+                    prompt[i]["inputs"]["fanout_index"] = urls.index(remote_url)
                 output_src = i
                 # Apply remote parameters
                 for param, value, nodeid in remote_params:
@@ -110,6 +121,7 @@ def dispatch_to_remote(remote_url, prompt, job_id=f"{get_client_id()}-unknown",
     
     banned = [] if outputs == "any" else ["PreviewImage", "SaveImage"] # get_output_nodes(remote_url)
     output = None
+    to_prune = []
     for i in prompt.keys():
         # only leave current fetch but replace with PreviewImage
         if prompt[i]["class_type"] == "FetchRemote":
@@ -119,10 +131,16 @@ def dispatch_to_remote(remote_url, prompt, job_id=f"{get_client_id()}-unknown",
                     "class_type": 'PreviewImage',
                     "final_output": True, # might allow multiple outputs with an ID?
                 }
-            recursive_node_deletion(i)
+                # send the raw tensor back if the remote has NetDist installed
+                transfer = prompt[i]["inputs"].get("transfer", "png")
+                if transfer != "png" and has_netdist_route(remote_url, "tensor"):
+                    output["class_type"] = "NetDistTensorOutput"
+                    output["inputs"]["precision"] = "fp16" if transfer == "tensor_fp16" else "fp32"
+            to_prune.append(i)
         # do not save output on remote
         if prompt[i]["class_type"] in banned:
-            recursive_node_deletion(i)
+            to_prune.append(i)
+    to_del = find_descendants(prompt, to_prune)
     if output:
         prompt[str(max([int(x) for x in prompt.keys()])+1)] = output
     for i in to_del: del prompt[i]
@@ -141,8 +159,16 @@ def dispatch_to_remote(remote_url, prompt, job_id=f"{get_client_id()}-unknown",
             if prompt[i]["class_type"] in sem_input_map.keys():
                 key = sem_input_map[prompt[i]["class_type"]]
                 prompt[i]["inputs"][key] = prompt[i]["inputs"][key].replace(sep_local, sep_remote)
+    return prompt
 
+def queue_remote_prompt(remote_url, prompt, job_id=f"{get_client_id()}-unknown", clear=False):
+    """Send a prompt from build_remote_prompt, returns the remote's prompt_id"""
     ### SEND REQUEST ###
+    # events sent before the socket is open are missed, that only costs latency
+    # (waiters re-check the history on connect) but it's cheap to avoid
+    listener = get_listener(remote_url)
+    if listener is not None:
+        listener.wait_connected()
     data = {
         "prompt": prompt,
         "client_id": get_client_id(),
@@ -150,11 +176,57 @@ def dispatch_to_remote(remote_url, prompt, job_id=f"{get_client_id()}-unknown",
             "job_id": job_id,
         }
     }
-    ar = requests.post(
-        f"{remote_url}/prompt",
-        data    = json.dumps(data),
-        headers = {"Content-Type": "application/json"},
-        timeout = 4,
-    )
-    ar.raise_for_status()
-    return
+    if has_netdist(remote_url):
+        # clears our old jobs and queues the new one in a single round trip
+        data["clear"] = clear
+        ar = submit_to_remote(remote_url, data)
+    else:
+        if clear:
+            clear_remote_queue(remote_url)
+        ar = post_json(f"{remote_url}/prompt", data)
+    try:
+        ar.raise_for_status()
+    except Exception:
+        invalidate(remote_url) # remote may have restarted with different nodes
+        raise
+    prompt_id = ar.json().get("prompt_id")
+    register_job(remote_url, job_id, prompt_id)
+    return prompt_id
+
+def dispatch_to_remote(remote_url, prompt, job_id=f"{get_client_id()}-unknown", remote_params=[], outputs="final_image", clear=False):
+	prompt = build_remote_prompt(remote_url, prompt, remote_params, outputs)
+	return queue_remote_prompt(remote_url, prompt, job_id, clear)
+
+TRIGGER_TOOLTIP = "on_change reuses cached results, which may be stale if the remote changed. always re-runs."
+
+def dispatch_cached(remote_url, prompt, job_id, remote_params=[], outputs="final_image", clear=False, reuse=True):
+	"""
+	Like dispatch_to_remote, but if the result of the same pruned prompt is
+	already in the result cache, nothing is cleared or sent. Returns
+	(prompt_id, cache_key), the prompt_id is None on a hit.
+	"""
+	prompt = build_remote_prompt(remote_url, prompt, remote_params, outputs)
+	cache_key = result_key(prompt)
+	if reuse and has_result(cache_key):
+		return None, cache_key
+	return queue_remote_prompt(remote_url, prompt, job_id, clear), cache_key
+
+def get_remote_info(remote_url, job_id, prompt_id, cache_key):
+	"""REMINFO for the fetch nodes, "cached" means the result is in the result cache"""
+	return {
+		"remote_url" : remote_url,
+		"job_id"     : job_id,
+		"prompt_id"  : prompt_id,
+		"cache_key"  : cache_key,
+		"cached"     : prompt_id is None,
+	}
+
+def dispatch_to_remotes(remote_urls, prompt, job_id, remote_params=[], outputs="final_image", reuse=True):
+	"""
+	Clear the queue and dispatch on all remotes concurrently (unless cached),
+	returns (prompt_id, cache_key) for each remote in order
+	"""
+	def start(remote_url):
+		return dispatch_cached(remote_url, prompt, job_id, remote_params, outputs, clear=True, reuse=reuse)
+	with ThreadPoolExecutor(max_workers=len(remote_urls)) as pool:
+		return list(pool.map(start, remote_urls))
@@ -1,11 +1,24 @@
 import time
 import json
+import threading
 import torch
-import requests
+import safetensors.torch
 import numpy as np
 from PIL import Image
+from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
 
-POLLING = 0.5
+from .utils import get_prompt_id
+from .session import http_get
+from .capabilities import has_netdist
+from .imageio import assemble_batch, get_text_metadata
+from .sidecar import resolve_info
+from .results import load_result, store_result
+from .listener import get_listener, get_generation, wait_for_update, check_interrupted, Interrupted, ProgressRelay
+from .dispatch import clear_remote_queue
+
+POLLING = 0.5 # only used when the websocket listener isn't connected
 
 def get_job_output(inputs, outputs):
 	output_id = list(outputs.keys())[-1] # fallback to last
@@ -13,85 +26,223 @@ def get_job_output(inputs, outputs):
 		if d.get("final_output") and i in outputs.keys():
 			output_id = i
 			break
-	return outputs[output_id].get("images", [])
+	return outputs[output_id]
+
+def find_job(remote_url, job_id, prompt_id=None):
+	"""Return the history entry for a job, or None if it isn't done yet."""
+	if prompt_id and has_netdist(remote_url):
+		r = http_get(f"{remote_url}/netdist/status/{prompt_id}")
+		r.raise_for_status()
+		status = r.json()
+		if status["status"] == "unknown":
+			raise OSError(f"Job '{job_id}' is no longer queued on {remote_url}")
+		return status.get("history")
+	if prompt_id:
+		r = http_get(f"{remote_url}/history/{prompt_id}")
+		r.raise_for_status()
+		return r.json().get(prompt_id)
+	# job queued by something that didn't record the ID, scan everything
+	r = http_get(f"{remote_url}/history")
+	r.raise_for_status()
+	for i,d in r.json().items():
+		if d["prompt"][3].get("job_id") == job_id:
+			return d
+	return None
 
-def wait_for_job(remote_url, job_id):
+def wait_for_job(remote_url, job_id, prompt_id=None, timeout=None, cancel=None):
+	"""'cancel' is an optional threading.Event, once set waiting stops with CancelledError"""
+	prompt_id = prompt_id or get_prompt_id(remote_url, job_id)
+	listener = get_listener(remote_url)
+	start = time.time()
 	fail = 0
 	while fail <= 3:
-		r = requests.get(f"{remote_url}/history", timeout=4)
+		if timeout is not None and time.time() - start > timeout:
+			raise TimeoutError(f"Job '{job_id}' on {remote_url} did not finish in {timeout}s")
+		if cancel is not None and cancel.is_set():
+			raise CancelledError(f"Stopped waiting for job '{job_id}' on {remote_url}")
+		seen = get_generation(listener) # before the request so no event is lost
 		try:
-			r.raise_for_status()
+			d = find_job(remote_url, job_id, prompt_id)
 		except Exception as e:
 			print("NetDist caught error while fetching output image:\n", e)
 			fail += 1
-			continue
-		data = r.json()
-		if not data:
 			time.sleep(POLLING)
 			continue
-		for i,d in data.items():
-			if d["prompt"][3].get("job_id") == job_id:
-				# this needs to be less jank
-				if len(d["outputs"].keys()) > 0:
-					return get_job_output(d["prompt"][2], d["outputs"])
-				else:
-					return []
+		if d is not None:
+			# this needs to be less jank
+			if len(d["outputs"].keys()) > 0:
+				return get_job_output(d["prompt"][2], d["outputs"])
+			else:
+				return {}
 		# todo: check if it's actually in the queue to avoid waiting forever
-		time.sleep(POLLING)
+		wait_for_update(listener, seen, POLLING)
 	raise OSError("Failed to fetch image from remote client!")
 
-def fetch_from_remote(remote_url, job_id):
-	def img_to_torch(img):
-		image = img.convert("RGB")
-		image = np.array(image).astype(np.float32) / 255.0
-		image_tensor = torch.from_numpy(image)[None,]
-		image_tensor.metadata = img.info  # Store metadata in tensor attribute
-		return image_tensor
+DOWNLOAD_WORKERS = 8   # images downloaded/decoded in parallel overall
+PER_REMOTE_LIMIT = 4   # ...and at most this many from the same remote
 
-	if not remote_url or not job_id:
-		return None
+DOWNLOAD_POOL = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="netdist-download")
+REMOTE_SLOTS = {}
+REMOTE_SLOTS_LOCK = threading.Lock()
+
+def get_remote_slots(remote_url):
+	with REMOTE_SLOTS_LOCK:
+		if remote_url not in REMOTE_SLOTS:
+			REMOTE_SLOTS[remote_url] = threading.Semaphore(PER_REMOTE_LIMIT)
+		return REMOTE_SLOTS[remote_url]
 
-	images = []
-	for i in wait_for_job(remote_url, job_id):
-		img_url = f"{remote_url}/view?filename={i['filename']}&subfolder={i['subfolder']}&type={i['type']}"
+def download_image(remote_url, i):
+	"""Download and decode a single output image to an RGB uint8 array + its metadata"""
+	img_url = f"{remote_url}/view?filename={i['filename']}&subfolder={i['subfolder']}&type={i['type']}"
+	with get_remote_slots(remote_url):
+		with http_get(img_url, stream=True) as ir:
+			ir.raise_for_status()
+			data = ir.content
+	# decoding doesn't need the remote, let the next download start
+	img = Image.open(BytesIO(data))
+	return np.asarray(img.convert("RGB")), get_text_metadata(img)
 
-		ir = requests.get(img_url, stream=True, timeout=16)
-		ir.raise_for_status()
-		img = Image.open(ir.raw)
-		images.append(img_to_torch(img))
+def download_tensor(remote_url, t):
+	"""Load the raw IMAGE tensor written by NetDistTensorOutput, skips the PNG round trip"""
+	with get_remote_slots(remote_url):
+		with http_get(f"{remote_url}/netdist/tensor/{t['filename']}", stream=True) as r:
+			r.raise_for_status()
+			data = r.content
+	return safetensors.torch.load(data)["images"].to(torch.float32)
 
-	if len(images) == 0:
-		return None
+def download_job(remote_url, job_id, prompt_id=None, timeout=None, cancel=None):
+	"""Wait for a job and load its output images, returns the batch and the last image's metadata"""
+	output = wait_for_job(remote_url, job_id, prompt_id, timeout, cancel)
+	if output.get("tensors"):
+		out = torch.cat([download_tensor(remote_url, t) for t in output["tensors"]])
+		return out, {}
+	decoded = list(DOWNLOAD_POOL.map(lambda i: download_image(remote_url, i), output.get("images", [])))
+	if len(decoded) == 0:
+		return None, {}
 
-	out = images[0]
-	for i in images[1:]:
-		out = torch.cat((out, i))
-	return out
+	out = assemble_batch([image for image, _ in decoded])
+	info = decoded[-1][1]
+	out.metadata = info  # Store metadata in tensor attribute
+	return out, info
 
-#with extras returns both the output and the metadata from the images generated remotely
-def fetch_from_remote_with_extras(remote_url, job_id):
-	def img_to_torch(img):
-		image = img.convert("RGB")
-		image = np.array(image).astype(np.float32) / 255.0
-		image_tensor = torch.from_numpy(image)[None,]
-		return image_tensor
+PREFETCH_WORKERS = 16  # jobs that can be watched in the background at once
+PREFETCH_LIMIT = 64    # unclaimed results kept before the oldest are dropped
+PREFETCH_TIMEOUT = 3600
 
-	if not remote_url or not job_id:
-		return None
+PREFETCH_POOL = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="netdist-prefetch")
+PREFETCH = OrderedDict() # (remote_url, job_id) -> (future, cancel event)
+PREFETCH_LOCK = threading.Lock()
 
-	images = []
-	for i in wait_for_job(remote_url, job_id):
-		img_url = f"{remote_url}/view?filename={i['filename']}&subfolder={i['subfolder']}&type={i['type']}"
+def start_prefetch(remote_url, job_id, prompt_id=None):
+	"""Start watching a freshly dispatched job so the result is ready by the time it's fetched"""
+	cancel = threading.Event()
+	future = PREFETCH_POOL.submit(download_job, remote_url, job_id, prompt_id, PREFETCH_TIMEOUT, cancel)
+	with PREFETCH_LOCK:
+		PREFETCH[(remote_url, job_id)] = (future, cancel)
+		while len(PREFETCH) > PREFETCH_LIMIT:
+			# future.cancel() only works while queued, a running one stops on the event
+			old_future, old_cancel = PREFETCH.popitem(last=False)[1]
+			old_cancel.set()
+			old_future.cancel()
 
-		ir = requests.get(img_url, stream=True, timeout=16)
-		ir.raise_for_status()
-		img = Image.open(ir.raw)
-		images.append(img_to_torch(img))
+def take_prefetch(remote_url, job_id):
+	with PREFETCH_LOCK:
+		return PREFETCH.pop((remote_url, job_id), None)
 
-	if len(images) == 0:
-		return None
+def run_in_thread(fn, *args):
+	future = Future()
+	def run():
+		try:
+			future.set_result(fn(*args))
+		except Exception as e:
+			future.set_exception(e)
+	threading.Thread(target=run, daemon=True).start()
+	return future
+
+def wait_with_progress(remote_url, prompt_id, future, progress=None):
+	"""Wait for a download in the calling thread, raises Interrupted if the local prompt is cancelled"""
+	listener = get_listener(remote_url)
+	if progress is not None and listener is not None and prompt_id:
+		ProgressRelay(listener, prompt_id, progress).run_until(future)
+	while True:
+		check_interrupted()
+		try:
+			return future.result(timeout=POLLING)
+		except FutureTimeout:
+			pass
+
+def cancel_remote(remote_url, cancel):
+	"""Stop waiting for our job and drop it from the remote's queue"""
+	cancel.set()
+	try:
+		clear_remote_queue(remote_url)
+	except Exception as e:
+		print(f"NetDist: failed to cancel the job on {remote_url}:\n", e)
+
+def fetch_job(remote_url, job_id, prompt_id=None, progress=None):
+	"""
+	Return (images, metadata) for a job, from the prefetch if there is one.
+	'progress' is called from this thread with the remote's progress/previews.
+	A local cancel also cancels the job on the remote.
+	"""
+	prompt_id = prompt_id or get_prompt_id(remote_url, job_id)
+	entry = take_prefetch(remote_url, job_id)
+	try:
+		# cancel() only succeeds if it hasn't started yet (stuck behind other
+		# prefetches), fetching directly is quicker than waiting for a free worker
+		if entry is not None and not entry[0].cancel():
+			try:
+				return wait_with_progress(remote_url, prompt_id, entry[0], progress)
+			except Interrupted:
+				raise
+			except Exception as e:
+				print("NetDist prefetch failed, fetching directly:\n", e)
+		entry = (None, threading.Event())
+		future = run_in_thread(download_job, remote_url, job_id, prompt_id, None, entry[1])
+		return wait_with_progress(remote_url, prompt_id, future, progress)
+	except Interrupted:
+		cancel_remote(remote_url, entry[1])
+		raise
+
+def fetch_job_or_none(remote_url, job_id, prompt_id=None, progress=None):
+	if not remote_url or not job_id:
+		return None, {}
+	return fetch_job(remote_url, job_id, prompt_id, progress)
+
+def fetch_from_remote(remote_url, job_id, prompt_id=None, progress=None):
+	out, info = fetch_job_or_none(remote_url, job_id, prompt_id, progress)
+	return out
+
+#with extras returns both the output and the metadata from the images generated remotely
+def fetch_from_remote_with_extras(remote_url, job_id, prompt_id=None, progress=None):
+	if not remote_url or not job_id:
+		return None, {}
+	out, info = fetch_job(remote_url, job_id, prompt_id, progress)
+	# latents/conditionings saved as sidecars only have a reference in the PNG
+	info = resolve_info(info, remote_url)
+	if out is not None:
+		out.metadata = info
+	return out, info
 
-	out = images[0]
-	for i in images[1:]:
-		out = torch.cat((out, i))
-	return out, img.info
\ No newline at end of file
+def fetch_remote_info(remote_info, progress=None, extras=False):
+	"""
+	(images, metadata) for a REMINFO. Results of cache hits come from the
+	result cache without contacting the remote, others are stored there.
+	"""
+	key = remote_info.get("cache_key")
+	remote_url = remote_info.get("remote_url")
+	if remote_info.get("cached"):
+		result = load_result(key)
+		if result is None:
+			raise OSError(f"NetDist: cached result '{key}' is gone, please queue the prompt again")
+		# the key ignores remote_url, sidecars have to come from the remote that made the result
+		out, info, remote_url = result[0], result[1], result[2] or remote_url
+	else:
+		out, info = fetch_job_or_none(remote_url, remote_info.get("job_id"), remote_info.get("prompt_id"), progress)
+		# stored with the sidecar references, not the (possibly MB sized) base64 they point to
+		store_result(key, out, info, remote_url)
+	if extras:
+		info = resolve_info(info, remote_url)
+		if out is not None:
+			out.metadata = info
+	return out, info
@@ -0,0 +1,98 @@
+import json
+import hashlib
+from copy import deepcopy
+from collections import deque
+
+def is_link(value):
+	"""API prompt inputs that point at another node look like ["node_id", output_index]"""
+	return type(value) == list and len(value) > 0 and isinstance(value[0], str)
+
+def build_dependents(prompt):
+	"""Reverse dependency index, node_id -> set of node_ids that take one of its outputs"""
+	dependents = {}
+	for node, data in prompt.items():
+		inputs = data.get("inputs")
+		if not inputs:
+			continue
+		for i in inputs.values():
+			if is_link(i):
+				dependents.setdefault(i[0], set()).add(node)
+	return dependents
+
+def find_descendants(prompt, roots, dependents=None):
+	"""All roots plus every node that (indirectly) depends on one, in O(N+E)"""
+	if dependents is None:
+		dependents = build_dependents(prompt)
+	found = set(roots)
+	queue = deque(found)
+	while queue:
+		for node in dependents.get(queue.popleft(), ()):
+			if node not in found:
+				found.add(node)
+				queue.append(node)
+	return found
+
+def canonical_json(obj):
+	"""Stable JSON encoding, equal prompts always give the same string"""
+	return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+def prompt_hash(prompt):
+	return hashlib.sha256(canonical_json(prompt).encode("utf-8")).hexdigest()
+
+def same_json(a, b):
+	# plain == treats 1, 1.0 and True as equal, which would drop a type change
+	return canonical_json(a) == canonical_json(b)
+
+def diff_prompt(base, prompt):
+	"""
+	Patch that turns 'base' into 'prompt'. Changed inputs of otherwise equal
+	nodes are sent one by one, anything else replaces the whole node:
+	  {"nodes": {id: node}, "inputs": {id: {name: value}}, "drop": {id: [name]}, "remove": [id]}
+	Empty parts are left out, so identical prompts give {}.
+	"""
+	nodes, inputs, drop = {}, {}, {}
+	for node_id, node in prompt.items():
+		old = base.get(node_id)
+		if old is None or not same_json({k: v for k, v in old.items() if k != "inputs"}, {k: v for k, v in node.items() if k != "inputs"}):
+			nodes[node_id] = node
+			continue
+		new_in, old_in = node.get("inputs", {}), old.get("inputs", {})
+		changed = {k: v for k, v in new_in.items() if k not in old_in or not same_json(old_in[k], v)}
+		gone = [k for k in old_in if k not in new_in]
+		if changed:
+			inputs[node_id] = changed
+		if gone:
+			drop[node_id] = gone
+	patch = {
+		"nodes": nodes,
+		"inputs": inputs,
+		"drop": drop,
+		"remove": [node_id for node_id in base if node_id not in prompt],
+	}
+	return {k: v for k, v in patch.items() if v}
+
+def apply_patch(base, patch):
+	"""Inverse of diff_prompt, returns a new prompt and leaves 'base' untouched"""
+	remove = set(patch.get("remove", []))
+	prompt = {k: deepcopy(v) for k, v in base.items() if k not in remove}
+	for node_id, node in patch.get("nodes", {}).items():
+		prompt[node_id] = node
+	for node_id, changed in patch.get("inputs", {}).items():
+		prompt[node_id].setdefault("inputs", {}).update(changed)
+	for node_id, names in patch.get("drop", {}).items():
+		for name in names:
+			prompt[node_id].get("inputs", {}).pop(name, None)
+	return prompt
+
+def result_key(prompt):
+	"""
+	Hash of a pruned remote prompt for the result cache. The queue nodes'
+	remote_url is ignored, it doesn't change the output, so a result can be
+	reused no matter which remote made it.
+	"""
+	stripped = {}
+	for node_id, node in prompt.items():
+		if node.get("class_type", "").startswith("RemoteQueue") and "remote_url" in node.get("inputs", {}):
+			node = {**node, "inputs": {k: v for k, v in node["inputs"].items() if k != "remote_url"}}
+		stripped[node_id] = node
+	return prompt_hash(stripped)
@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+from .utils import get_cache_dir, evict_lru
+from .session import http_get
+
+# On-disk cache for files loaded from URLs. Bodies are stored by content hash
+# (so the same file behind two URLs is only kept once), with a small JSON
+# entry per URL holding the hash and the server's ETag/Last-Modified, which
+# are used to revalidate instead of downloading again.
+CACHE_LIMIT = int(os.environ.get("NETDIST_CACHE_LIMIT", 2048)) * 2**20 # MB, least recently used files are dropped above this
+MAX_AGE = 60.0 # seconds a revalidated entry is trusted without asking again
+CHUNK_SIZE = 2**20
+
+LOCK = threading.Lock()
+CHECKED = {} # url : last revalidation time
+
+def get_entry_path(url):
+	return os.path.join(get_cache_dir("http/urls"), f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.json")
+
+def get_data_path(digest):
+	return os.path.join(get_cache_dir("http/data"), digest)
+
+def load_entry(url):
+	"""Cache entry of a URL or None, entries without a body are ignored"""
+	try:
+		with open(get_entry_path(url)) as f:
+			entry = json.load(f)
+	except (OSError, ValueError):
+		return None
+	if entry.get("url") != url or not os.path.isfile(get_data_path(entry["digest"])):
+		return None
+	return entry
+
+def save_entry(url, entry):
+	path = get_entry_path(url)
+	tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+	with open(tmp, "w") as f:
+		json.dump(entry, f)
+	os.replace(tmp, path)
+
+def touch(entry):
+	# the mtime of the body is what the eviction sorts by
+	os.utime(get_data_path(entry["digest"]))
+
+def get_validator(entry):
+	return entry.get("etag") or entry.get("last_modified") or entry["digest"]
+
+def download(url, entry=None):
+	"""Conditional GET, streams the body into the cache. Returns the (new) entry."""
+	headers = {}
+	if entry is not None:
+		if entry.get("etag"):
+			headers["If-None-Match"] = entry["etag"]
+		if entry.get("last_modified"):
+			headers["If-Modified-Since"] = entry["last_modified"]
+	with http_get(url, stream=True, headers=headers) as r:
+		if r.status_code == 304 and entry is not None:
+			touch(entry)
+			return entry
+		r.raise_for_status()
+		m = hashlib.sha256()
+		tmp = os.path.join(get_cache_dir("http/data"), f"{time.time_ns()}.{threading.get_ident()}.tmp")
+		try:
+			with open(tmp, "wb") as f:
+				for chunk in r.iter_content(CHUNK_SIZE):
+					m.update(chunk)
+					f.write(chunk)
+			digest = m.hexdigest()
+			os.replace(tmp, get_data_path(digest))
+		finally:
+			if os.path.exists(tmp):
+				os.remove(tmp)
+		entry = {
+			"url": url,
+			"digest": digest,
+			"etag": r.headers.get("ETag"),
+			"last_modified": r.headers.get("Last-Modified"),
+		}
+	save_entry(url, entry)
+	evict_lru(get_cache_dir("http/data"), CACHE_LIMIT, keep=digest)
+	return entry
+
+def fetch(url, max_age=MAX_AGE):
+	"""
+	Return the cache entry for a URL, downloading or revalidating it if it
+	wasn't checked in the last 'max_age' seconds.
+	"""
+	entry = load_entry(url)
+	with LOCK:
+		fresh = entry is not None and time.time() - CHECKED.get(url, 0) < max_age
+	if fresh:
+		touch(entry)
+		return entry
+	entry = download(url, entry)
+	with LOCK:
+		CHECKED[url] = time.time()
+	return entry
+
+def fetch_path(url, max_age=MAX_AGE):
+	"""Local path of the cached body of a URL"""
+	return get_data_path(fetch(url, max_age)["digest"])
+
+def download_temp(url, suffix=""):
+	"""Stream a URL into a temp file without caching it, the caller removes it"""
+	fd, path = tempfile.mkstemp(suffix=suffix, prefix="netdist-")
+	try:
+		with os.fdopen(fd, "wb") as f, http_get(url, stream=True) as r:
+			r.raise_for_status()
+			for chunk in r.iter_content(CHUNK_SIZE):
+				f.write(chunk)
+	except Exception:
+		os.remove(path)
+		raise
+	return path
+
+def check_url(url):
+	"""
+	For IS_CHANGED: revalidate now and return the validator. Changed content
+	is downloaded right away, so the following load is a cache hit.
+	"""
+	try:
+		return get_validator(fetch(url, max_age=0))
+	except Exception as e:
+		print(f"NetDist: failed to check {url}:\n", e)
+		entry = load_entry(url)
+		return get_validator(entry) if entry else url
@@ -0,0 +1,105 @@
+import os
+import torch
+import numpy as np
+from io import BytesIO
+from collections import deque
+from PIL import Image
+from PIL.PngImagePlugin import PngInfo
+from concurrent.futures import ThreadPoolExecutor
+
+# what to do when images in one batch differ in size: "error", "resize" or "crop"
+SIZE_POLICY = os.environ.get("NETDIST_SIZE_POLICY", "error")
+
+def fit_image(image, height, width, policy):
+	"""Make an RGB uint8 array match the batch size according to the policy"""
+	if policy == "resize":
+		img = Image.fromarray(image).resize((width, height), Image.LANCZOS)
+		return np.asarray(img)
+	if policy == "crop":
+		# center crop, pad with black where the image is smaller
+		out = np.zeros((height, width, 3), dtype=np.uint8)
+		h, w = min(height, image.shape[0]), min(width, image.shape[1])
+		sy, sx = (image.shape[0] - h) // 2, (image.shape[1] - w) // 2
+		dy, dx = (height - h) // 2, (width - w) // 2
+		out[dy:dy+h, dx:dx+w] = image[sy:sy+h, sx:sx+w]
+		return out
+	raise ValueError(f"Image size mismatch in batch! {image.shape[:2]} vs {(height, width)}")
+
+def assemble_batch(images, policy=None):
+	"""
+	Write RGB uint8 arrays into a single preallocated [B,H,W,3] float tensor.
+	The first image decides the size, others are fitted using the policy.
+	"""
+	policy = policy or SIZE_POLICY
+	height, width = images[0].shape[:2]
+	out = torch.empty((len(images), height, width, 3), dtype=torch.float32)
+	view = out.numpy() # shares memory, converts straight from uint8 on assignment
+	for k, image in enumerate(images):
+		if image.shape[:2] != (height, width):
+			image = fit_image(image, height, width, policy)
+		view[k] = image
+	np.divide(view, 255.0, out=view)
+	return out
+
+# PIL releases the GIL while compressing, so a batch encodes in parallel
+ENCODE_WORKERS = int(os.environ.get("NETDIST_ENCODE_WORKERS", min(8, os.cpu_count() or 1)))
+ENCODE_POOL = ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix="netdist-encode")
+
+# name : (PIL format, extension, mime type)
+IMAGE_FORMATS = {
+	"png"           : ("PNG",  "png",  "image/png"),
+	"webp_lossless" : ("WEBP", "webp", "image/webp"),
+}
+EXIF_FIRST_TAG = 0x0110 # same layout as ComfyUI's webp/animated saves, counting down
+
+def tensor_to_pil(image):
+	i = 255. * image.cpu().numpy()
+	return Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
+
+def encode_image(img, fmt="png", compress_level=4, text=None):
+	"""
+	Encode a PIL image, 'text' is a list of (key, value) metadata strings.
+	PNGs store them as text chunks, WebP as "key:value" EXIF entries.
+	compress_level is 0-9 for both, for WebP it's mapped to the encoder effort.
+	"""
+	buffer = BytesIO()
+	text = text or []
+	if fmt == "webp_lossless":
+		exif = Image.Exif()
+		for k, (key, value) in enumerate(text):
+			exif[EXIF_FIRST_TAG - k] = f"{key}:{value}"
+		img.save(buffer, "WEBP", lossless=True, quality=round(compress_level * 100 / 9), method=round(compress_level * 6 / 9), exif=exif)
+	else:
+		meta = PngInfo()
+		for key, value in text:
+			meta.add_text(key, value)
+		img.save(buffer, "PNG", pnginfo=meta, compress_level=compress_level)
+	return buffer.getvalue()
+
+def get_text_metadata(img):
+	"""Text metadata of an image saved by encode_image, from PNG chunks or WebP EXIF"""
+	info = dict(img.info)
+	if img.format == "WEBP":
+		for value in img.getexif().values():
+			if isinstance(value, str) and ":" in value:
+				key, text = value.split(":", 1)
+				info.setdefault(key, text)
+	return info
+
+def parallel_map(fn, items):
+	"""Ordered map over the encode pool, the first error is raised"""
+	return list(ENCODE_POOL.map(fn, items))
+
+def iter_map(fn, items, window=None):
+	"""
+	Lazy ordered map over the encode pool, with at most 'window' results in
+	flight, so a consumer can send each one before the whole batch is done.
+	"""
+	window = window or ENCODE_WORKERS
+	pending = deque()
+	for item in items:
+		pending.append(ENCODE_POOL.submit(fn, item))
+		if len(pending) >= window:
+			yield pending.popleft().result()
+	while pending:
+		yield pending.popleft().result()
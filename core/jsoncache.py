@@ -0,0 +1,68 @@
+import threading
+from collections import OrderedDict
+
+from .digest import file_digest
+
+CACHE_LIMIT = 32 # parsed files kept in memory
+
+def read_only(self, *args, **kwargs):
+	raise TypeError("Cached workflows are read-only, use copy.deepcopy() to get an editable copy")
+
+class FrozenDict(dict):
+	"""
+	Read-only dict shared between all users of a cached parse. Still a dict,
+	so lookups and json.dumps work as usual, deepcopy returns a plain dict.
+	"""
+	__setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = __ior__ = read_only
+
+	def __deepcopy__(self, memo):
+		return thaw(self)
+
+	def __reduce__(self):
+		return (dict, (thaw(self),))
+
+class FrozenList(list):
+	"""Read-only list, see FrozenDict"""
+	__setitem__ = __delitem__ = __iadd__ = __imul__ = append = extend = insert = pop = remove = clear = sort = reverse = read_only
+
+	def __deepcopy__(self, memo):
+		return thaw(self)
+
+	def __reduce__(self):
+		return (list, (thaw(self),))
+
+def freeze(obj):
+	if isinstance(obj, dict):
+		return FrozenDict((k, freeze(v)) for k, v in obj.items())
+	if isinstance(obj, list):
+		return FrozenList(freeze(v) for v in obj)
+	return obj
+
+def thaw(obj):
+	# only containers are rebuilt, the JSON scalars are immutable anyway
+	if isinstance(obj, dict):
+		return {k: thaw(v) for k, v in obj.items()}
+	if isinstance(obj, list):
+		return [thaw(v) for v in obj]
+	return obj
+
+PARSED = OrderedDict() # (digest, parser) : frozen result
+PARSED_LOCK = threading.Lock()
+
+def load_cached(path, parser):
+	"""
+	Parse a file once per version of its content. 'parser' takes the path and
+	returns JSON-like data; the result is shared, so it's returned read-only.
+	Errors aren't cached and are raised on every call.
+	"""
+	key = (file_digest(path), parser.__qualname__)
+	with PARSED_LOCK:
+		if key in PARSED:
+			PARSED.move_to_end(key)
+			return PARSED[key]
+	data = freeze(parser(path))
+	with PARSED_LOCK:
+		PARSED[key] = data
+		while len(PARSED) > CACHE_LIMIT:
+			PARSED.popitem(last=False)
+	return data
@@ -0,0 +1,219 @@
+import json
+import time
+import struct
+import threading
+
+try:
+	import websocket # websocket-client, optional
+except ImportError:
+	websocket = None
+
+try:
+	import comfy.model_management as model_management
+	Interrupted = model_management.InterruptProcessingException
+except ImportError: # outside of ComfyUI, e.g. mass-process
+	model_management = None
+	class Interrupted(Exception):
+		pass
+
+from .utils import get_client_id
+
+RECONNECT = 2.0     # delay between reconnect attempts
+RECV_TIMEOUT = 30.0 # idle socket timeout before recv is retried
+FALLBACK = 5.0      # re-check the history this often even without events
+PREVIEW_INTERVAL = 0.5 # min. seconds between relayed previews
+CONNECT_WAIT = 1.0  # max. seconds a new listener is given to connect before queueing
+
+# binary websocket frames, see BinaryEventTypes in ComfyUI's server.py
+PREVIEW_IMAGE = 1
+PREVIEW_IMAGE_WITH_METADATA = 4
+PREVIEW_FORMATS = {1: "JPEG", 2: "PNG", "image/jpeg": "JPEG", "image/png": "PNG", "image/webp": "WEBP"}
+
+class RemoteListener:
+	"""
+	Single websocket connection to a remote, shared by all jobs waiting on it.
+	Waiters are woken whenever the remote reports a finished node/prompt and
+	then re-check the history themselves, so a missed event only costs latency.
+	"""
+	def __init__(self, remote_url, client_id):
+		self.remote_url = remote_url
+		self.client_id = client_id
+		self.connected = False
+		self.attempted = False # first connection attempt finished, successful or not
+		self.generation = 0 # bumped when something finished
+		self.updates = 0    # bumped on any event, including progress
+		self.running = None # prompt_id currently executing on the remote
+		self.progress = {}  # prompt_id : (value, max)
+		self.previews = {}  # prompt_id : (update, format, image bytes)
+		self.cond = threading.Condition()
+		self.thread = threading.Thread(target=self.run, daemon=True)
+		self.thread.start()
+
+	def ws_url(self):
+		url = self.remote_url.replace("https://", "wss://", 1).replace("http://", "ws://", 1)
+		return f"{url}/ws?clientId={self.client_id}"
+
+	def notify(self, done=True):
+		with self.cond:
+			if done:
+				self.generation += 1
+			self.updates += 1
+			self.cond.notify_all()
+
+	def wait(self, generation, timeout, updates=None):
+		"""
+		Block until something finished after 'generation' or, if 'updates' is
+		set, until any other event arrives. False on timeout.
+		"""
+		with self.cond:
+			return self.cond.wait_for(
+				lambda: self.generation != generation or (updates is not None and self.updates != updates),
+				timeout
+			)
+
+	def wait_connected(self, timeout=CONNECT_WAIT):
+		"""
+		Give a new listener a moment to connect, so events of a prompt queued
+		right after are received. Returns at once if the first attempt is over.
+		"""
+		with self.cond:
+			return self.cond.wait_for(lambda: self.connected or self.attempted, timeout)
+
+	def finish(self, prompt_id):
+		self.progress.pop(prompt_id, None)
+		self.previews.pop(prompt_id, None)
+		if self.running == prompt_id:
+			self.running = None
+		self.notify()
+
+	def handle(self, msg):
+		kind = msg.get("type")
+		data = msg.get("data") or {}
+		if kind == "progress":
+			self.progress[data.get("prompt_id") or self.running] = (data["value"], data["max"])
+			self.notify(done=False)
+		elif kind == "execution_start":
+			self.running = data.get("prompt_id")
+		elif kind in ["execution_success", "execution_error", "execution_interrupted"]:
+			self.finish(data.get("prompt_id"))
+		elif kind == "executed":
+			self.notify()
+		elif kind == "executing":
+			if data.get("node") is None:
+				self.finish(data.get("prompt_id")) # older remotes only send this once a prompt is done
+			else:
+				self.running = data.get("prompt_id") or self.running
+
+	def handle_binary(self, msg):
+		event = struct.unpack(">I", msg[:4])[0]
+		if event == PREVIEW_IMAGE:
+			fmt = PREVIEW_FORMATS.get(struct.unpack(">I", msg[4:8])[0])
+			prompt_id, image = self.running, msg[8:]
+		elif event == PREVIEW_IMAGE_WITH_METADATA:
+			size = struct.unpack(">I", msg[4:8])[0]
+			meta = json.loads(msg[8:8+size])
+			fmt = PREVIEW_FORMATS.get(meta.get("image_type"))
+			prompt_id, image = meta.get("prompt_id") or self.running, msg[8+size:]
+		else:
+			return
+		if fmt and prompt_id:
+			# only the latest frame is kept, older ones are never decoded
+			self.previews[prompt_id] = (self.updates, fmt, image)
+			self.notify(done=False)
+
+	def run(self):
+		while True:
+			try:
+				ws = websocket.create_connection(self.ws_url(), timeout=4)
+			except Exception:
+				self.attempted = True
+				self.notify(done=False)
+				time.sleep(RECONNECT)
+				continue
+			ws.settimeout(RECV_TIMEOUT)
+			self.connected = self.attempted = True
+			self.notify() # anything could have finished while we were disconnected
+			try:
+				while True:
+					try:
+						msg = ws.recv()
+					except websocket.WebSocketTimeoutException:
+						continue
+					if isinstance(msg, str):
+						self.handle(json.loads(msg))
+					else:
+						self.handle_binary(msg)
+			except Exception as e:
+				print(f"NetDist: lost websocket connection to {self.remote_url}:\n", e)
+			finally:
+				self.connected = False
+				ws.close()
+				self.notify() # let waiters fall back to polling
+			time.sleep(RECONNECT)
+
+LISTENERS = {}
+LISTENERS_LOCK = threading.Lock()
+
+def get_listener(remote_url, client_id=None):
+	"""Return the shared listener for a remote, or None if websockets aren't available."""
+	if websocket is None:
+		return None
+	key = (remote_url, client_id or get_client_id())
+	with LISTENERS_LOCK:
+		if key not in LISTENERS:
+			LISTENERS[key] = RemoteListener(*key)
+		return LISTENERS[key]
+
+def get_generation(listener):
+	return listener.generation if listener else None
+
+def wait_for_update(listener, generation, polling):
+	"""Wait for the next event on the listener, or sleep for one polling interval without one."""
+	if listener is not None and listener.connected:
+		listener.wait(generation, FALLBACK)
+	else:
+		time.sleep(polling)
+
+def check_interrupted():
+	"""Raise ComfyUI's InterruptProcessingException if the local prompt was cancelled"""
+	if model_management is not None:
+		model_management.throw_exception_if_processing_interrupted()
+
+class ProgressRelay:
+	"""
+	Forwards progress and previews of one remote prompt to a callback as
+	callback(value, max, preview), where preview is (format, image bytes) or
+	None. Previews are rate limited to one per PREVIEW_INTERVAL.
+	"""
+	def __init__(self, listener, prompt_id, callback):
+		self.listener = listener
+		self.prompt_id = prompt_id
+		self.callback = callback
+		self.last_progress = None
+		self.last_preview = None
+		self.last_preview_time = 0
+
+	def relay(self):
+		progress = self.listener.progress.get(self.prompt_id)
+		preview = self.listener.previews.get(self.prompt_id)
+		if progress is None:
+			return
+		send = None
+		if preview is not None and preview[0] != self.last_preview:
+			if time.time() - self.last_preview_time >= PREVIEW_INTERVAL:
+				send = preview[1:]
+				self.last_preview = preview[0]
+				self.last_preview_time = time.time()
+		if progress != self.last_progress or send is not None:
+			self.last_progress = progress
+			self.callback(progress[0], progress[1], send)
+
+	def run_until(self, future):
+		"""Relay until the future is done. Must be called from the thread that owns the callback."""
+		future.add_done_callback(lambda f: self.listener.notify(done=False))
+		while not future.done():
+			check_interrupted()
+			generation, updates = self.listener.generation, self.listener.updates
+			self.relay()
+			# short timeout so a throttled preview still goes out once things go quiet
+			self.listener.wait(generation, PREVIEW_INTERVAL, updates)
@@ -0,0 +1,58 @@
+import os
+import json
+import threading
+import torch
+import safetensors.torch
+
+from .utils import get_cache_dir, evict_lru
+
+# Fetched remote outputs, keyed by the hash of the pruned prompt that made
+# them (see graph.result_key). A re-run with the same prompt and seed is
+# then served from disk without touching any remote. 0 disables it.
+RESULT_LIMIT = int(os.environ.get("NETDIST_RESULT_CACHE", 4096)) * 2**20 # MB
+
+def is_enabled():
+	return RESULT_LIMIT > 0
+
+def get_result_path(key):
+	return os.path.join(get_cache_dir("results"), f"{key}.safetensors")
+
+def has_result(key):
+	return is_enabled() and os.path.isfile(get_result_path(key))
+
+def store_result(key, images, info=None, remote_url=None):
+	"""
+	Save fetched images + their (text) metadata, no-op if disabled or already
+	stored. Sidecar references in 'info' should be left unresolved, they're
+	resolved against 'remote_url' (the remote that made them) on load.
+	"""
+	if not key or images is None or not is_enabled():
+		return
+	path = get_result_path(key)
+	if os.path.isfile(path):
+		return
+	info = {k: v for k, v in (info or {}).items() if isinstance(v, str)}
+	tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+	safetensors.torch.save_file(
+		{"images": images.contiguous().cpu()}, tmp,
+		metadata={"info": json.dumps(info), "remote_url": remote_url or ""},
+	)
+	os.replace(tmp, path)
+	evict_lru(get_cache_dir("results"), RESULT_LIMIT, keep=os.path.basename(path))
+
+def load_result(key):
+	"""(images, info, remote_url) of a cached result, or None if it's not (or no longer) there"""
+	path = get_result_path(key)
+	if not os.path.isfile(path):
+		return None
+	try:
+		with safetensors.safe_open(path, framework="pt") as f:
+			images = f.get_tensor("images").to(torch.float32)
+			metadata = f.metadata() or {}
+			info = json.loads(metadata.get("info", "{}"))
+		os.utime(path) # mark as recently used
+	except Exception as e:
+		print(f"NetDist: failed to load cached result {key}:\n", e)
+		return None
+	images.metadata = info
+	return images, info, metadata.get("remote_url") or None
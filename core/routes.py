@@ -0,0 +1,145 @@
+# NetDist API routes on the remote's PromptServer.
+# Only imported when running as a custom node.
+import os
+import threading
+from copy import deepcopy
+import folder_paths
+from collections import OrderedDict
+from aiohttp import web
+from server import PromptServer
+
+from .graph import apply_patch, prompt_hash
+
+routes = PromptServer.instance.routes
+
+TENSOR_SUBFOLDER = "netdist" # inside the temp dir
+TENSOR_LIMIT = int(os.environ.get("NETDIST_TENSOR_LIMIT", 1024)) * 2**20 # MB, oldest outputs are dropped above this
+
+def get_tensor_dir():
+	path = os.path.join(folder_paths.get_temp_directory(), TENSOR_SUBFOLDER)
+	os.makedirs(path, exist_ok=True)
+	return path
+
+@routes.get("/netdist/tensor/{filename}")
+async def get_tensor(request):
+	"""Raw safetensors file written by NetDistTensorOutput"""
+	base = os.path.abspath(get_tensor_dir())
+	path = os.path.abspath(os.path.join(base, request.match_info["filename"]))
+	if os.path.dirname(path) != base or not os.path.isfile(path):
+		return web.Response(status=404)
+	return web.FileResponse(path, headers={"Content-Type": "application/octet-stream"})
+
+BASE_LIMIT = 16 # base prompts kept for delta submits, shared by all hosts
+BASES = OrderedDict() # prompt hash : prompt
+BASES_LOCK = threading.Lock()
+
+def store_base(prompt):
+	key = prompt_hash(prompt)
+	with BASES_LOCK:
+		BASES[key] = prompt
+		BASES.move_to_end(key)
+		while len(BASES) > BASE_LIMIT:
+			BASES.popitem(last=False)
+	return key
+
+def get_base(key):
+	with BASES_LOCK:
+		if key in BASES:
+			BASES.move_to_end(key)
+		return BASES.get(key)
+
+def get_queue_items():
+	running, pending = PromptServer.instance.prompt_queue.get_current_queue()
+	return running, pending
+
+def cancel_client_jobs(client_id):
+	"""Drop pending jobs of a client and interrupt the running one only if it's theirs"""
+	import nodes # ComfyUI's, not ours
+	queue = PromptServer.instance.prompt_queue
+	running, pending = get_queue_items()
+	cancelled = []
+	for k in pending:
+		if k[3].get("client_id") == client_id:
+			queue.delete_queue_item(lambda a, prompt_id=k[1]: a[1] == prompt_id)
+			cancelled.append(k[1])
+	for k in running:
+		if k[3].get("client_id") == client_id:
+			nodes.interrupt_processing()
+			cancelled.append(k[1])
+	return cancelled
+
+class JSONRequest:
+	"""Just enough of a request for the stock /prompt handler"""
+	def __init__(self, data):
+		self.data = data
+
+	async def json(self):
+		return self.data
+
+def get_prompt_handler():
+	# looked up lazily, stock routes are only added after custom nodes load
+	for route in PromptServer.instance.app.router.routes():
+		if route.method == "POST" and route.resource is not None and route.resource.canonical == "/prompt":
+			return route.handler
+	return None
+
+@routes.get("/netdist/info")
+async def get_info(request):
+	"""Lets hosts detect that NetDist is installed on this remote"""
+	return web.json_response({
+		"version": 1,
+		"routes": ["submit", "status", "cancel", "tensor", "delta"],
+	})
+
+@routes.post("/netdist/submit")
+async def post_submit(request):
+	"""
+	Same body as /prompt. With "clear": true, the client's previous jobs are
+	cancelled first, so a dispatch only needs this single round trip.
+	With "save_base": true the prompt is also kept as a base, later submits
+	can then send {"base": <prompt hash>, "patch": <diff>} instead of the
+	full prompt. An unknown base, or a rebuilt prompt that doesn't match the
+	expected "hash", is a 409, the host then sends the full prompt again.
+	"""
+	data = await request.json()
+	handler = get_prompt_handler()
+	if handler is None:
+		return web.json_response({"error": "/prompt route not found"}, status=501)
+	if "base" in data:
+		base = get_base(data.pop("base"))
+		if base is None:
+			return web.json_response({"error": "unknown base"}, status=409)
+		data["prompt"] = apply_patch(base, data.pop("patch", {}))
+		expected = data.pop("hash", None)
+		if expected is not None and prompt_hash(data["prompt"]) != expected:
+			return web.json_response({"error": "patched prompt doesn't match"}, status=409)
+	elif data.pop("save_base", False):
+		store_base(deepcopy(data["prompt"]))
+	if data.pop("clear", False) and data.get("client_id"):
+		cancel_client_jobs(data["client_id"])
+	return await handler(JSONRequest(data))
+
+@routes.get("/netdist/status/{prompt_id}")
+async def get_status(request):
+	"""Queue state and, once done, the full history entry incl. outputs"""
+	prompt_id = request.match_info["prompt_id"]
+	# queue first, finished jobs move to the history atomically
+	running, pending = get_queue_items()
+	if any(k[1] == prompt_id for k in running):
+		return web.json_response({"status": "running"})
+	pending = sorted(pending, key=lambda k: k[0])
+	for position, k in enumerate(pending):
+		if k[1] == prompt_id:
+			return web.json_response({"status": "pending", "position": position})
+	history = PromptServer.instance.prompt_queue.get_history(prompt_id=prompt_id)
+	if prompt_id in history:
+		return web.json_response({"status": "done", "history": history[prompt_id]})
+	return web.json_response({"status": "unknown"})
+
+@routes.post("/netdist/cancel")
+async def post_cancel(request):
+	"""Cancel all jobs of one client_id without touching anyone else's"""
+	data = await request.json()
+	if not data.get("client_id"):
+		return web.json_response({"error": "client_id required"}, status=400)
+	return web.json_response({"cancelled": cancel_client_jobs(data["client_id"])})
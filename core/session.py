@@ -0,0 +1,50 @@
+import os
+import threading
+import requests
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+
+POOL_SIZE = int(os.environ.get("NETDIST_POOL_SIZE", 8))              # keep-alive connections per remote
+TIMEOUT = float(os.environ.get("NETDIST_TIMEOUT", 4))                # queue/history/prompt calls
+DATA_TIMEOUT = float(os.environ.get("NETDIST_DATA_TIMEOUT", 16))     # image/latent downloads and uploads
+
+SESSIONS = {}
+SESSIONS_LOCK = threading.Lock()
+
+def configure(pool_size=None, timeout=None, data_timeout=None):
+	"""Override the pool size/timeouts. Existing pools are recreated on next use."""
+	global POOL_SIZE, TIMEOUT, DATA_TIMEOUT
+	if pool_size is not None:
+		POOL_SIZE = int(pool_size)
+	if timeout is not None:
+		TIMEOUT = float(timeout)
+	if data_timeout is not None:
+		DATA_TIMEOUT = float(data_timeout)
+	with SESSIONS_LOCK:
+		for s in SESSIONS.values():
+			s.close()
+		SESSIONS.clear()
+
+def get_session(url):
+	"""Pooled keep-alive session shared by all requests to the same remote (scheme+host+port)."""
+	key = urlsplit(url)[:2]
+	with SESSIONS_LOCK:
+		if key not in SESSIONS:
+			s = requests.Session()
+			adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+			s.mount("http://", adapter)
+			s.mount("https://", adapter)
+			SESSIONS[key] = s
+		return SESSIONS[key]
+
+def http_get(url, stream=False, **kwargs):
+	kwargs.setdefault("timeout", DATA_TIMEOUT if stream else TIMEOUT)
+	return get_session(url).get(url, stream=stream, **kwargs)
+
+def http_post(url, **kwargs):
+	kwargs.setdefault("timeout", TIMEOUT)
+	return get_session(url).post(url, **kwargs)
+
+def http_upload(url, **kwargs):
+	kwargs.setdefault("timeout", DATA_TIMEOUT)
+	return get_session(url).post(url, **kwargs)
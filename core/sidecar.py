@@ -0,0 +1,93 @@
+import os
+import re
+import base64
+import hashlib
+import threading
+import folder_paths
+from collections import OrderedDict
+
+from .session import http_get
+
+# Large tensors saved alongside images are stored once per batch as
+# content-addressed files in output/netdist, the PNG only gets a reference:
+#   ndref:<sha256>.<ext>
+# Since the name is the hash, a host can keep fetched sidecars in the same
+# folder and never download the same one twice.
+REF_PREFIX = "ndref:"
+SIDECAR_SUBFOLDER = "netdist"
+SIDECAR_NAME = re.compile(r"^[0-9a-f]{64}\.(ndl|ndc)$")
+RESOLVED_LIMIT = 8 # decoded base64 strings kept in memory
+
+RESOLVED = OrderedDict() # filename : base64 string
+RESOLVED_LOCK = threading.Lock()
+
+def get_sidecar_dir():
+	path = os.path.join(folder_paths.get_output_directory(), SIDECAR_SUBFOLDER)
+	os.makedirs(path, exist_ok=True)
+	return path
+
+def is_ref(text):
+	return isinstance(text, str) and text.startswith(REF_PREFIX)
+
+def get_ref_name(ref):
+	name = ref[len(REF_PREFIX):]
+	if not SIDECAR_NAME.match(name):
+		raise ValueError(f"Invalid sidecar reference '{ref}'")
+	return name
+
+def store_sidecar(data, name):
+	"""Atomically write a sidecar, no-op if it already exists"""
+	path = os.path.join(get_sidecar_dir(), name)
+	if not os.path.isfile(path):
+		tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+		with open(tmp, "wb") as f:
+			f.write(data)
+		os.replace(tmp, path)
+	return path
+
+def write_sidecar(data, ext):
+	"""Store raw bytes (e.g. from encode_latent_bytes) and return the reference"""
+	name = f"{hashlib.sha256(data).hexdigest()}.{ext}"
+	store_sidecar(data, name)
+	return f"{REF_PREFIX}{name}"
+
+def download_sidecar(remote_url, name):
+	url = f"{remote_url}/view?filename={name}&subfolder={SIDECAR_SUBFOLDER}&type=output"
+	with http_get(url, stream=True) as r:
+		r.raise_for_status()
+		data = r.content
+	if hashlib.sha256(data).hexdigest() != name.split(".")[0]:
+		raise OSError(f"Sidecar '{name}' from {remote_url} is corrupt")
+	store_sidecar(data, name)
+	return data
+
+def read_sidecar(ref, remote_url=None):
+	"""Raw bytes of a sidecar, from disk or, if missing and a remote is given, downloaded once"""
+	name = get_ref_name(ref)
+	path = os.path.join(get_sidecar_dir(), name)
+	if os.path.isfile(path):
+		with open(path, "rb") as f:
+			return f.read()
+	if remote_url is None:
+		raise FileNotFoundError(f"Sidecar '{name}' not found in {os.path.dirname(path)}")
+	return download_sidecar(remote_url, name)
+
+def resolve_ref(text, remote_url=None):
+	"""Turn a reference back into the base64 string the decode nodes expect, anything else passes through"""
+	if not is_ref(text):
+		return text
+	name = get_ref_name(text)
+	with RESOLVED_LOCK:
+		if name in RESOLVED:
+			RESOLVED.move_to_end(name)
+			return RESOLVED[name]
+	resolved = base64.b64encode(read_sidecar(text, remote_url)).decode("utf-8")
+	with RESOLVED_LOCK:
+		RESOLVED[name] = resolved
+		while len(RESOLVED) > RESOLVED_LIMIT:
+			RESOLVED.popitem(last=False)
+	return resolved
+
+def resolve_info(info, remote_url=None):
+	"""Copy of an image info dict with all sidecar references resolved"""
+	return {k: resolve_ref(v, remote_url) for k, v in info.items()}
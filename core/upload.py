@@ -0,0 +1,35 @@
+import uuid
+
+from .session import http_upload
+
+def multipart_body(files, boundary):
+	"""Generator over a multipart/form-data body, 'files' yields (filename, mime type, bytes)"""
+	for filename, mime, data in files:
+		yield (
+			f"--{boundary}\r\n"
+			f"Content-Disposition: form-data; name=\"images\"; filename=\"{filename}\"\r\n"
+			f"Content-Type: {mime}\r\n\r\n"
+		).encode("utf-8")
+		yield data
+		yield b"\r\n"
+	yield f"--{boundary}--\r\n".encode("utf-8")
+
+def post_multipart(url, files):
+	"""
+	Stream files as one chunked multipart request. Each part is sent as soon
+	as it's produced, so only the images in flight are held in memory.
+	"""
+	boundary = f"netdist-{uuid.uuid4().hex}"
+	headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+	with http_upload(url, data=multipart_body(files, boundary), headers=headers) as r:
+		r.raise_for_status()
+
+def post_raw(url, filename, mime, data):
+	"""One image per request, the body is just the encoded file"""
+	headers = {
+		"Content-Type": mime,
+		"Content-Disposition": f"attachment; filename=\"{filename}\"",
+		"X-Filename": filename,
+	}
+	with http_upload(url, data=data, headers=headers) as r:
+		r.raise_for_status()
@@ -1,3 +1,4 @@
+import os
 import time
 import random
 
@@ -21,3 +22,40 @@ def clean_url(raw, multi=False):
 	raw = raw.replace(' ', ',').replace('\n', ',').replace('\t', ',')
 	urls = [x.rstrip('/') for x in raw.split(',') if x.strip()]
 	return urls if multi else urls[0]
+
+# (remote_url, job_id) -> prompt_id, filled in on dispatch
+JOB_INDEX = {}
+
+def register_job(remote_url, job_id, prompt_id):
+	JOB_INDEX[(remote_url, job_id)] = prompt_id
+
+def get_prompt_id(remote_url, job_id):
+	return JOB_INDEX.get((remote_url, job_id))
+
+# on-disk caches (URL downloads, file digests, ...)
+CACHE_DIR = os.environ.get("NETDIST_CACHE_DIR") or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache")
+
+def get_cache_dir(kind=None):
+	path = os.path.join(CACHE_DIR, kind) if kind else CACHE_DIR
+	os.makedirs(path, exist_ok=True)
+	return path
+
+def evict_lru(path, limit, keep=None):
+	"""Delete the least recently used (oldest mtime) files in a folder until it's under 'limit' bytes"""
+	files = []
+	with os.scandir(path) as it:
+		for e in it:
+			if e.is_file() and not e.name.endswith(".tmp"):
+				st = e.stat()
+				files.append((st.st_mtime, st.st_size, e.path))
+	total = sum(x[1] for x in files)
+	for _, size, file in sorted(files):
+		if total <= limit:
+			break
+		if os.path.basename(file) == keep:
+			continue
+		try:
+			os.remove(file)
+			total -= size
+		except OSError:
+			pass
@@ -1,8 +1,8 @@
 import os
+import sys
 import time
 import yaml
 import json
-import requests
 import argparse
 from PIL import Image
 from tqdm import tqdm
@@ -10,12 +10,21 @@ from queue import Queue
 from copy import deepcopy
 from threading import Thread
 
+# share the remote helpers with the custom nodes
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.listener import get_listener, get_generation, wait_for_update
+from core.session import configure, http_get, http_post
+
+CLIENT_ID = "netdist-mass"
+POLLING = 0.5 # only used when the websocket listener isn't connected
+
 class JobShard:
 	def __init__(self, workflow, job_num):
 		self.workflow = workflow  # raw workflow
 		self.job_num = job_num    # numerical ID of job
 		self.prompt = None        # created when assigned to worker
 		self.job_id = None        # ^
+		self.prompt_id = None     # returned by the remote on submit
 
 	def format_workflow(self, rep, system, job_num):
 		w = deepcopy(self.workflow)
@@ -66,41 +75,47 @@ class Worker:
 			self.prog.update()
 
 	def start_job(self):
+		listener = get_listener(self.url, CLIENT_ID)
+		if listener is not None:
+			listener.wait_connected() # so the first completion event isn't missed
 		url = f"{self.url}/prompt"
 		data = {
 			"prompt": self.job.prompt,
-			"client_id": "netdist-mass",
+			"client_id": CLIENT_ID,
 			"extra_data": {
 				"job_id": self.job.job_id,
 			}
 		}
-		r = requests.post(url, json=data)
+		r = http_post(url, json=data)
 		r.raise_for_status()
+		self.job.prompt_id = r.json().get("prompt_id")
 
 	def wait_for_job(self):
-		url = self.url + "/history"
+		url = f"{self.url}/history/{self.job.prompt_id}"
+		listener = get_listener(self.url, CLIENT_ID)
 		image_data = None
 		while not image_data:
-			r = requests.get(url)
+			seen = get_generation(listener)
+			r = http_get(url)
 			r.raise_for_status()
 			data = r.json()
-			if not data:
-				time.sleep(0.5)
-				continue
 			for i,d in data.items():
 				if d["prompt"][3].get("job_id") == self.job.job_id:
 					image_data = d["outputs"][list(d["outputs"].keys())[-1]].get("images")
 					break
-			time.sleep(0.5)
+			if not image_data:
+				wait_for_update(listener, seen, POLLING)
 		return image_data
 
 	def fetch_job(self):
 		images = []
 		for i in self.wait_for_job():
 			img_url = f"{self.url}/view?filename={i['filename']}&subfolder={i['subfolder']}&type={i['type']}"
-			ir = requests.get(img_url, stream=True)
-			ir.raise_for_status()
-			images.append(Image.open(ir.raw))
+			with http_get(img_url, stream=True) as ir:
+				ir.raise_for_status()
+				img = Image.open(ir.raw)
+				img.load()
+			images.append(img)
 
 		if len(images) == 0:
 			print(f"{self.name}@{self.url} job failed")
@@ -129,6 +144,12 @@ if __name__ == "__main__":
 	with open(args.conf) as f:
 		conf = yaml.safe_load(f.read())
 
+	configure(
+		pool_size = conf.get("pool_size"),
+		timeout = conf.get("timeout"),
+		data_timeout = conf.get("data_timeout"),
+	)
+
 	if not os.path.isdir("output"):
 		os.mkdir("output")
 
@@ -1,7 +1,9 @@
+from ..core.fetch import start_prefetch
 from ..core.utils import clean_url, get_client_id, get_new_job_id
-from ..core.dispatch import dispatch_to_remote, clear_remote_queue
+from ..core.dispatch import dispatch_cached, dispatch_to_remotes, get_remote_info, TRIGGER_TOOLTIP
 
 import copy
+import time
 
 class RemoteApplyValues:
     """Apply values to remote nodes"""
@@ -77,7 +79,7 @@ class RemoteChainStartNux:
 		return {
 			"required": {
 				"workflow": ("JSON",),
-				"trigger": (["on_change", "always"],),
+				"trigger": (["on_change", "always"], {"tooltip": TRIGGER_TOOLTIP}),
 				"batch": ("INT", {"default": 1, "min": 1, "max": 8}),
 				"seed": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff}),
 			},
@@ -155,6 +157,7 @@ class RemoteChainStartNux:
 			"prompt": workflow,
 			"seed_offset": batch,
 			"job_id": get_new_job_id(),
+			"reuse": trigger != "always",
 		}
 		return(remote_chain,)
 
@@ -183,7 +186,7 @@ class RemoteChainStart:
 		return {
 			"required": {
 				"workflow": ("JSON",),
-				"trigger": (["on_change", "always"],),
+				"trigger": (["on_change", "always"], {"tooltip": TRIGGER_TOOLTIP}),
 				"batch": ("INT", {"default": 1, "min": 1, "max": 8}),
 				"seed": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff}),
 			},
@@ -261,6 +264,7 @@ class RemoteChainStart:
 			"prompt": workflow,
 			"seed_offset": batch,
 			"job_id": get_new_job_id(),
+			"reuse": trigger != "always",
 		}
 		return(remote_chain,)
 
@@ -343,22 +347,86 @@ class RemoteQueueWorker:
             return (remote_chain, {})
 
         remote_url = clean_url(remote_url)
-        clear_remote_queue(remote_url)
         
         # Prepare remote parameters
         remote_params = {}
 
-        dispatch_to_remote(
+        prompt_id, cache_key = dispatch_cached(
             remote_url,
             remote_chain["prompt"],
             remote_chain["job_id"],
             remote_params,
             outputs,
+            clear=True,
+            reuse=remote_chain.get("reuse", True),
         )
-        remote_info = {
-            "remote_url" : remote_url,
-            "job_id"     : remote_chain["job_id"],
+        if prompt_id is not None:
+            start_prefetch(remote_url, remote_chain["job_id"], prompt_id)
+        remote_info = get_remote_info(remote_url, remote_chain["job_id"], prompt_id, cache_key)
+        return (remote_chain, remote_info)
+
+class RemoteQueueFanout:
+    """Start job on several remote workers at once"""
+    def __init__(self):
+        pass
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "remote_chain": ("REMCHAIN",),
+                "remote_url": ("STRING", {
+                    "multiline": True,
+                    "default": "http://127.0.0.1:8288/\nhttp://127.0.0.1:8388/",
+                }),
+                "batch_override": ("INT", {"default": 0, "min": 0, "max": 8}),
+                "enabled": (["true", "false", "remote"],{"default": "true"}),
+                "outputs": (["final_image", "any"],{"default":"final_image"}),
+            },
+            "optional": {
+                # filled in by dispatch_to_remote on each remote, not meant to be connected
+                "fanout_index": ("INT", {"default": 0, "min": 0, "max": 64, "forceInput": True}),
+            },
         }
+
+    RETURN_TYPES = ("REMCHAIN", "REMINFO")
+    RETURN_NAMES = ("remote_chain", "remote_info")
+    OUTPUT_IS_LIST = (False, True) # one REMINFO per remote
+    FUNCTION = "queue"
+    CATEGORY = "remote/advanced"
+    TITLE = "Queue on remote (fan-out)"
+
+    def queue(self, remote_chain, remote_url, batch_override, enabled, outputs, fanout_index=0):
+        remote_urls = clean_url(remote_url, multi=True)
+        if not remote_urls:
+            raise ValueError("Queue on remote (fan-out): no remote URL given")
+        step = 1 if batch_override == 0 else batch_override
+        current_offset = remote_chain["seed_offset"]
+        remote_chain["seed_offset"] += step * len(remote_urls)
+        if enabled == "false":
+            return (remote_chain, [{}])
+        if enabled == "remote":
+            # apply offset from previous nodes in chain + previous remotes in this node
+            remote_chain["seed"] += current_offset + step * fanout_index
+            if batch_override > 0:
+                remote_chain["batch"] = batch_override
+            return (remote_chain, [{}])
+
+        dispatched = dispatch_to_remotes(
+            remote_urls,
+            remote_chain["prompt"],
+            remote_chain["job_id"],
+            {},
+            outputs,
+            reuse=remote_chain.get("reuse", True),
+        )
+        remote_info = [
+            get_remote_info(url, remote_chain["job_id"], prompt_id, cache_key)
+            for url, (prompt_id, cache_key) in zip(remote_urls, dispatched)
+        ]
+        for info in remote_info:
+            if not info["cached"]:
+                start_prefetch(info["remote_url"], info["job_id"], info["prompt_id"])
         return (remote_chain, remote_info)
 
 NODE_CLASS_MAPPINGS = {
@@ -366,6 +434,7 @@ NODE_CLASS_MAPPINGS = {
 	"RemoteChainStart(Nux)": RemoteChainStartNux,
 	"RemoteChainStart"  : RemoteChainStart,
 	"RemoteQueueWorker" : RemoteQueueWorker,
+	"RemoteQueueFanout" : RemoteQueueFanout,
 	"RemoteChainEnd"    : RemoteChainEnd,
 	"RemoteApplyValuesMulti(Nux)": RemoteApplyValuesMulti,
 }
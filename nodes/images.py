@@ -1,12 +1,16 @@
 import os
 import json
 import torch
-import requests
 import numpy as np
 from PIL import Image
-from PIL.PngImagePlugin import PngInfo
 from base64 import b64encode
-from io import BytesIO
+
+from concurrent.futures import ThreadPoolExecutor
+
+from ..core.imageio import IMAGE_FORMATS, tensor_to_pil, encode_image, parallel_map, iter_map
+from ..core.upload import post_multipart, post_raw
+from ..core.session import http_upload
+from ..core.httpcache import fetch_path, check_url
 
 class LoadImageUrl:
 	def __init__(self):
@@ -26,9 +30,8 @@ class LoadImageUrl:
 	TITLE = "Load Image (URL)"
 
 	def load_image_url(self, url):
-		with requests.get(url, stream=True) as r:
-			r.raise_for_status()
-			i = Image.open(r.raw)
+		# usually a cache hit, IS_CHANGED just revalidated it
+		i = Image.open(fetch_path(url))
 		image = i.convert("RGB")
 		image = np.array(image).astype(np.float32) / 255.0
 		image = torch.from_numpy(image)[None,]
@@ -39,6 +42,10 @@ class LoadImageUrl:
 			mask = torch.zeros((64,64), dtype=torch.float32, device="cpu")
 		return (image, mask)
 
+	@classmethod
+	def IS_CHANGED(s, url):
+		return check_url(url)
+
 class SaveImageUrl:
 	def __init__(self):
 		pass
@@ -50,7 +57,12 @@ class SaveImageUrl:
 				"images": ("IMAGE", ),
 				"url": ("STRING", { "multiline": False, }),
 				"filename_prefix": ("STRING", {"default": "ComfyUI"}),
-				"data_format": (["HTML_image", "Raw_data"],)
+				"data_format": (["HTML_image", "Raw_data", "Multipart_stream", "Raw_bytes"],)
+			},
+			"optional": {
+				"image_format": (list(IMAGE_FORMATS.keys()), {"default": "png"}),
+				"compress_level": ("INT", {"default": 4, "min": 0, "max": 9}),
+				"concurrency": ("INT", {"default": 4, "min": 1, "max": 32, "tooltip": "Parallel requests for Raw_bytes (one image per request)"}),
 			},
 			"hidden": {"prompt": "PROMPT", "extra_pnginfo": "EXTRA_PNGINFO"},
 		}
@@ -61,32 +73,37 @@ class SaveImageUrl:
 	CATEGORY = "remote/image"
 	TITLE = "Save Image (URL)"
 
-	def save_images(self, images, url, data_format, filename_prefix="ComfyUI", prompt=None, extra_pnginfo=None):
+	def save_images(self, images, url, data_format, filename_prefix="ComfyUI", image_format="png", compress_level=4, concurrency=4, prompt=None, extra_pnginfo=None):
 		filename = os.path.basename(os.path.normpath(filename_prefix))
-
-		counter = 1
-		data = {}
-		for image in images:
-			i = 255. * image.cpu().numpy()
-			img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-			meta = PngInfo()
-			if prompt is not None:
-				meta.add_text("prompt", json.dumps(prompt))
-			if extra_pnginfo is not None:
-				for x in extra_pnginfo:
-					meta.add_text(x, json.dumps(extra_pnginfo[x]))
-		
-			file = f"{filename}_{counter:05}.png"
-
-			buffer = BytesIO()
-			img.save(buffer, "png", pnginfo=meta, compress_level=4)
-			buffer.seek(0)
-			encoded = b64encode(buffer.read()).decode('utf-8')
-			data[file] = f"data:image/png;base64,{encoded}" if data_format == "HTML_image" else encoded
-			counter += 1
-
-		with requests.post(url, json=data) as r:
-			r.raise_for_status()
+		_, ext, mime = IMAGE_FORMATS[image_format]
+
+		text = []
+		if prompt is not None:
+			text.append(("prompt", json.dumps(prompt)))
+		if extra_pnginfo is not None:
+			for x in extra_pnginfo:
+				text.append((x, json.dumps(extra_pnginfo[x])))
+
+		def encode(job):
+			# runs on the encode pool
+			counter, image = job
+			file = f"{filename}_{counter:05}.{ext}"
+			return file, mime, encode_image(tensor_to_pil(image), image_format, compress_level, text)
+
+		jobs = list(enumerate(images, start=1))
+		if data_format == "Multipart_stream":
+			# each part goes out as soon as it's encoded
+			post_multipart(url, iter_map(encode, jobs))
+		elif data_format == "Raw_bytes":
+			with ThreadPoolExecutor(max_workers=concurrency) as pool:
+				list(pool.map(lambda job: post_raw(url, *encode(job)), jobs))
+		else:
+			data = {}
+			for file, _, raw in parallel_map(encode, jobs):
+				encoded = b64encode(raw).decode('utf-8')
+				data[file] = f"data:{mime};base64,{encoded}" if data_format == "HTML_image" else encoded
+			with http_upload(url, json=data) as r:
+				r.raise_for_status()
 		return ()
 
 class CombineImageBatch:
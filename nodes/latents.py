@@ -1,15 +1,18 @@
 import os
 import torch
-import requests
 import safetensors.torch
 import numpy as np
-import io
-from io import BytesIO
 import json
 from PIL import Image, ImageDraw, ImageFont, ImageOps, ImageEnhance
-from PIL.PngImagePlugin import PngInfo
 import folder_paths
-import base64
+
+from ..core.codec import encode_latent, decode_latent, validate_latent, encode_conditioning, decode_conditioning
+from ..core.codec import encode_latent_bytes, encode_conditioning_bytes
+from ..core.sidecar import write_sidecar, resolve_ref
+from ..core.digest import file_digest
+from ..core.dirindex import list_files
+from ..core.httpcache import fetch_path, download_temp
+from ..core.imageio import IMAGE_FORMATS, tensor_to_pil, encode_image, get_text_metadata, parallel_map
 
 
 
@@ -20,12 +23,14 @@ class LoadLatentNumpy:
 	@classmethod
 	def INPUT_TYPES(s):
 		exts = [".latent", ".safetensors", ".npy", ".npz"]
-		input_dir = folder_paths.get_input_directory()
-		files = [f for f in os.listdir(input_dir) if os.path.isfile(os.path.join(input_dir, f))]
-		files = [f for f in files if any([f.endswith(x) for x in exts])]
+		files = list_files(folder_paths.get_input_directory(), exts)
 		return {
 			"required": {
-				"latent": [sorted(files), ]
+				"latent": [files, ]
+			},
+			"optional": {
+				"batch_start": ("INT", {"default": 0, "min": 0, "max": 0xffffffff, "tooltip": "First latent of the batch to load"}),
+				"batch_count": ("INT", {"default": 0, "min": 0, "max": 0xffffffff, "tooltip": "Number of latents to load, 0 for all. Only this part is read from disk."}),
 			},
 		}
 
@@ -34,62 +39,67 @@ class LoadLatentNumpy:
 	CATEGORY = "remote/latent"
 	TITLE = "Load Latent (Numpy)"
 
-	def load_comfy(self, file):
-		# From default node - renamed safetensors file
-		if type(file) == str:
-			data = safetensors.torch.load_file(file)
-		else:
-			data = safetensors.torch.load(file)
+	def get_batch_slice(self, shape, batch_start, batch_count):
+		# only [B,C,H,W] latents have a batch dim to slice
+		if len(shape) < 4:
+			return slice(None)
+		return slice(batch_start, batch_start + batch_count if batch_count else None)
 
-		latent = data["latent_tensor"].to(torch.float32)
-		if "latent_format_version_0" not in data:
+	def load_comfy(self, file, batch_start=0, batch_count=0):
+		# From default node - renamed safetensors file
+		# safe_open maps the file, only the requested part of the latent is read
+		with safetensors.safe_open(file, framework="pt") as f:
+			data = f.get_slice("latent_tensor")
+			latent = data[self.get_batch_slice(data.get_shape(), batch_start, batch_count)].to(torch.float32)
+			scaled = "latent_format_version_0" in f.keys()
+		if not scaled:
 			latent *= 1.0 / 0.18215 # XL?
 		return latent
 
-	def load_numpy(self, file):
-		# plain npy file - saved as-is
-		return torch.from_numpy(np.load(file))
+	def load_numpy(self, file, batch_start=0, batch_count=0):
+		# plain npy file - saved as-is, mapped and copied once into the result
+		data = np.load(file, mmap_mode="r")
+		data = data[self.get_batch_slice(data.shape, batch_start, batch_count)]
+		return torch.from_numpy(np.array(data, dtype=np.float32))
 
-	def load_koyha(self, file):
+	def load_koyha(self, file, batch_start=0, batch_count=0):
 		# generated by sd_scripts - npz
+		data = np.load(file)
 		if "latents" in data.keys():
 			latent = data["latents"]
 		else:
-			latent = [x for x in data.items() if x.shape > 3][0]
-		return torch.from_numpy(latent)
+			latent = [v for k, v in data.items() if len(v.shape) >= 3][0]
+		latent = latent[self.get_batch_slice(latent.shape, batch_start, batch_count)]
+		return torch.from_numpy(np.array(latent, dtype=np.float32))
 
-	def load(self, latent):
+	def load(self, latent, batch_start=0, batch_count=0):
 		path = folder_paths.get_annotated_filepath(latent)
 		name, ext = os.path.splitext(latent)
+		ext = ext.lower() # the file list matches extensions case-insensitively
 
 		if ext in [".latent", ".safetensors"]:
-			latent = self.load_comfy(path)
+			latent = self.load_comfy(path, batch_start, batch_count)
 		elif ext == ".npy":
-			latent = self.load_numpy(path)
+			latent = self.load_numpy(path, batch_start, batch_count)
 		elif ext == ".npz":
-			latent = self.load_koyha(path)
+			latent = self.load_koyha(path, batch_start, batch_count)
 		else:
 			try:
-				latent = self.load_numpy(path)
+				latent = self.load_numpy(path, batch_start, batch_count)
 			except:
 				raise ValueError(f"Unknown latent extension '{ext}'")
 
 		if len(latent.shape) == 3:
 			latent = latent.unsqueeze(0)
-		print("asdasd", latent.shape)
 
 		return ({"samples": latent.to(torch.float32)},)
 
 	@classmethod
-	def IS_CHANGED(s, latent):
-		image_path = folder_paths.get_annotated_filepath(latent)
-		m = hashlib.sha256()
-		with open(image_path, 'rb') as f:
-			m.update(f.read())
-		return m.digest().hex()
+	def IS_CHANGED(s, latent, batch_start=0, batch_count=0):
+		return file_digest(folder_paths.get_annotated_filepath(latent))
 
 	@classmethod
-	def VALIDATE_INPUTS(s, latent):
+	def VALIDATE_INPUTS(s, latent, batch_start=0, batch_count=0):
 		if not folder_paths.exists_annotated_filepath(latent):
 			return f"Invalid latent file '{latent}'"
 		return True
@@ -103,43 +113,46 @@ class LoadLatentUrl(LoadLatentNumpy):
 		return {
 			"required": {
 				"url": ("STRING", { "multiline": False, })
+			},
+			"optional": {
+				"cache": ("BOOLEAN", {"default": True, "tooltip": "Keep the file in the on-disk URL cache, revalidated with ETag/Last-Modified"}),
 			}
 		}
 
 	RETURN_TYPES = ("LATENT",)
 	TITLE = "Load Latent (URL)"
 
-	def load(self, url):
-		buffer = BytesIO()
-		with requests.get(url, stream=True, timeout=16) as r:
-			r.raise_for_status()
-			buffer.write(r.content)
-		buffer.seek(0)
-
-		if ".latent" in url or ".safetensors" in url:
-			latent = self.load_comfy(buffer)
-		elif ".npy" in url:
-			latent = self.load_numpy(buffer)
-		elif ".npz" in url:
-			latent = self.load_koyha(buffer)
-		else:
-			try:
-				latent = self.load_comfy(buffer)
-			except:
-				raise ValueError(f"Unknown latent extension '{url}'")
+	def load(self, url, cache=True):
+		ext = os.path.splitext(url.split("?")[0])[1]
+		# streamed to disk, the loaders then map the file instead of parsing a buffer
+		path = fetch_path(url) if cache else download_temp(url, ext)
+		try:
+			if ".latent" in url or ".safetensors" in url:
+				latent = self.load_comfy(path)
+			elif ".npy" in url:
+				latent = self.load_numpy(path)
+			elif ".npz" in url:
+				latent = self.load_koyha(path)
+			else:
+				try:
+					latent = self.load_comfy(path)
+				except:
+					raise ValueError(f"Unknown latent extension '{url}'")
+		finally:
+			if not cache:
+				os.remove(path)
 
 		if len(latent.shape) == 3:
 			latent = latent.unsqueeze(0)
 
-		del buffer
 		return ({"samples": latent.to(torch.float32)},)
 
 	@classmethod
-	def IS_CHANGED(s, url):
+	def IS_CHANGED(s, url, cache=True):
 		return str(url)
 
 	@classmethod
-	def VALIDATE_INPUTS(s, url):
+	def VALIDATE_INPUTS(s, url, cache=True):
 		return True
 
 class SaveLatentNumpy:
@@ -176,6 +189,10 @@ class LatentToBase64Nux:
         return {
             "required": {
                 "samples": ("LATENT",),
+            },
+            "optional": {
+                "precision": (["fp32", "fp16", "bf16"], {"default": "fp32"}),
+                "compression": (["zlib", "lzma", "none"], {"default": "zlib"}),
             }
         }
     
@@ -185,18 +202,9 @@ class LatentToBase64Nux:
     CATEGORY = "remote/latent"
     TITLE = "Latent to Base64"
 
-    def convert(self, samples):
-        # Convert the latent samples to a numpy array
-        latent_array = samples["samples"].numpy()
-        
-        # Save the numpy array to a bytes buffer
-        buffer = io.BytesIO()
-        np.save(buffer, latent_array)
-        buffer.seek(0)
-        
-        # Encode the bytes to base64
-        base64_latent = base64.b64encode(buffer.getvalue()).decode('utf-8')
-        
+    def convert(self, samples, precision="fp32", compression="zlib"):
+        # Compact header + (optionally downcast/compressed) raw tensor data
+        base64_latent = encode_latent(samples["samples"], precision, compression)
         return (base64_latent,)
 	
 
@@ -219,15 +227,8 @@ class LoadLatentFromBase64Nux:
 
     def load(self, base64_latent=""):
         try:
-            # Decode the base64 string
-            decoded_data = base64.b64decode(base64_latent)
-            
-            # Load the numpy array from the decoded data
-            buffer = io.BytesIO(decoded_data)
-            latent_array = np.load(buffer)
-            
-            # Convert numpy array to torch tensor
-            latent_tensor = torch.from_numpy(latent_array).to(torch.float32)
+            # Decode the base64 string, compact or legacy np.save format
+            latent_tensor = decode_latent(base64_latent).to(torch.float32)
             
             # Ensure the tensor has the correct shape (add batch dimension if necessary)
             if len(latent_tensor.shape) == 3:
@@ -247,15 +248,8 @@ class LoadLatentFromBase64Nux:
 
     @classmethod
     def VALIDATE_INPUTS(s, base64_latent):
-        if not base64_latent:
-            return "Base64 latent string is empty"
-        try:
-            decoded_data = base64.b64decode(base64_latent)
-            buffer = io.BytesIO(decoded_data)
-            np.load(buffer)
-        except:
-            return "Invalid base64 latent string"
-        return True
+        # only checks the header, the data itself is decoded once in load
+        return validate_latent(base64_latent)
 
 
 
@@ -265,6 +259,9 @@ class ConditioningToBase64:
         return {
             "required": {
                 "conditioning": ("CONDITIONING", {"tooltip": "The conditioning to be encoded as base64."}),
+            },
+            "optional": {
+                "precision": (["fp32", "fp16", "bf16"], {"default": "fp32"}),
             }
         }
     
@@ -274,29 +271,9 @@ class ConditioningToBase64:
     CATEGORY = "conditioning"
     TITLE = "Conditioning2Base64"
 
-    def convert(self, conditioning):
-        # Extract the conditioning data
-        cond_data, cond_meta = conditioning[0]
-        
-        # Convert tensors to numpy arrays
-        cond_data_np = cond_data.cpu().numpy()
-        cond_meta_serializable = {k: v.cpu().numpy() if isinstance(v, torch.Tensor) else v for k, v in cond_meta.items()}
-        
-        # Combine data and metadata into a single dictionary
-        combined_data = {
-            "cond_data": cond_data_np,
-            "cond_meta": cond_meta_serializable
-        }
-        
-        # Save the combined data to a bytes buffer
-        buffer = io.BytesIO()
-        np.savez_compressed(buffer, **combined_data)
-        buffer.seek(0)
-        
-        # Encode the bytes to base64
-        base64_conditioning = base64.b64encode(buffer.getvalue()).decode('utf-8')
-        
-        return (base64_conditioning,)
+    def convert(self, conditioning, precision="fp32"):
+        # Safetensors container with every tensor of every entry, see core/codec
+        return (encode_conditioning(conditioning, precision),)
 
 class ConditioningFromBase64:
     @classmethod
@@ -314,26 +291,9 @@ class ConditioningFromBase64:
 
     def convert(self, base64_conditioning):
         try:
-            # Decode the base64 string
-            decoded_data = base64.b64decode(base64_conditioning)
-            
-            # Load the numpy arrays from the decoded data
-            buffer = io.BytesIO(decoded_data)
-            loaded_data = np.load(buffer, allow_pickle=True)
-            
-            # Extract the conditioning data and metadata
-            cond_data_np = loaded_data['cond_data']
-            cond_meta_serializable = loaded_data['cond_meta'].item()
-            
-            # Convert numpy arrays back to tensors
-            cond_data = torch.from_numpy(cond_data_np)
-            cond_meta = {k: torch.from_numpy(v) if isinstance(v, np.ndarray) else v for k, v in cond_meta_serializable.items()}
-            
-            # Reconstruct the conditioning object
-            conditioning = [[cond_data, cond_meta]]
-            
+            # Reads both the safetensors container and the legacy npz strings
+            conditioning = decode_conditioning(base64_conditioning)
             return (conditioning,)
-        
         except Exception as e:
             raise ValueError(f"Failed to load conditioning from base64: {str(e)}")
 
@@ -436,7 +396,7 @@ class SaveImageWithBase64:
 		self.output_dir = folder_paths.get_output_directory()
 		self.type = "output"
 		self.prefix_append = ""
-		self.compress_level = 4
+		self.compress_level = 4 # default, see the compress_level input
 
 	@classmethod
 	def INPUT_TYPES(s):
@@ -449,7 +409,10 @@ class SaveImageWithBase64:
 				"workflowName": ("STRING", {"default": "",}),
 				"latent": ("LATENT",),
 				"positive_conditioning": ("CONDITIONING",),
-				"negative_conditioning": ("CONDITIONING",)
+				"negative_conditioning": ("CONDITIONING",),
+				"embed": (["sidecar", "inline"], {"default": "sidecar", "tooltip": "sidecar: tensors are written once per batch to output/netdist, the PNG only holds a reference. inline: base64 in every PNG."}),
+				"image_format": (list(IMAGE_FORMATS.keys()), {"default": "png"}),
+				"compress_level": ("INT", {"default": 4, "min": 0, "max": 9, "tooltip": "0 is fastest, 9 smallest. Images in a batch are encoded in parallel."}),
 			},
 			"hidden": {
 				"prompt": "PROMPT", "extra_pnginfo": "EXTRA_PNGINFO"
@@ -462,43 +425,47 @@ class SaveImageWithBase64:
 	CATEGORY = "image"
 	TITLE = "save conds and latents"
 
-	def save_images(self, images, filename_prefix="ComfyUI", workflowName="", latent=None, positive_conditioning=None, negative_conditioning=None, prompt=None, extra_pnginfo=None):
+	def save_images(self, images, filename_prefix="ComfyUI", workflowName="", latent=None, positive_conditioning=None, negative_conditioning=None, embed="sidecar", image_format="png", compress_level=None, prompt=None, extra_pnginfo=None):
 
 		def convertconditioning(conditioning):
-			cond_data, cond_meta = conditioning[0]
-			# Convert tensors to numpy arrays
-			cond_data_np = cond_data.cpu().numpy()
-			cond_meta_serializable = {k: v.cpu().numpy() if isinstance(v, torch.Tensor) else v for k, v in cond_meta.items()}
-			# Combine data and metadata into a single dictionary
-			combined_data = {
-				"cond_data": cond_data_np,
-				"cond_meta": cond_meta_serializable
-			}
-			# Save the combined data to a bytes buffer
-			buffer = io.BytesIO()
-			np.savez_compressed(buffer, **combined_data)
-			buffer.seek(0)
-			# Encode the bytes to base64
-			base64_conditioning = base64.b64encode(buffer.getvalue()).decode('utf-8')
-			return base64_conditioning
+			if embed == "sidecar":
+				return write_sidecar(encode_conditioning_bytes(conditioning), "ndc")
+			return encode_conditioning(conditioning)
 
 		def convertlatent(samples):
-			# Convert the latent samples to a numpy array
-			latent_array = samples["samples"].numpy()
-			# Save the numpy array to a bytes buffer
-			buffer = io.BytesIO()
-			np.save(buffer, latent_array)
-			buffer.seek(0)
-			# Encode the bytes to base64
-			base64_latent = base64.b64encode(buffer.getvalue()).decode('utf-8')	
-			return base64_latent
-		
+			if embed == "sidecar":
+				return write_sidecar(encode_latent_bytes(samples["samples"]), "ndl")
+			return encode_latent(samples["samples"])
+
+		# same for every image in the batch, only encode once
+		latent_base64 = convertlatent(latent) if latent is not None else None
+		p_conditioning_base64 = convertconditioning(positive_conditioning) if positive_conditioning is not None else None
+		n_conditioning_base64 = convertconditioning(negative_conditioning) if negative_conditioning is not None else None
+
+		if compress_level is None:
+			compress_level = self.compress_level
+		ext = IMAGE_FORMATS[image_format][1]
+
+		text = []
+		if prompt is not None:
+			text.append(("prompt", json.dumps(prompt)))
+		if extra_pnginfo is not None:
+			for x in extra_pnginfo:
+				text.append((x, json.dumps(extra_pnginfo[x])))
+		if latent_base64 is not None:
+			text.append(("latent_base64", latent_base64))
+		if p_conditioning_base64 is not None:
+			text.append(("conditioning_base64", p_conditioning_base64))
+		if n_conditioning_base64 is not None:
+			text.append(("conditioning_base64", n_conditioning_base64))
+
 		filename_prefix += self.prefix_append
 		full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(filename_prefix, self.output_dir, images[0].shape[1], images[0].shape[0])
-		results = list()
-		for (batch_number, image) in enumerate(images):
-			i = 255. * image.cpu().numpy()
-			img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
+
+		def save(job):
+			# runs on the encode pool, one image each
+			batch_number, image, counter = job
+			img = tensor_to_pil(image)
 
 			# Add text overlay if workflowName is not empty
 			if workflowName:
@@ -519,41 +486,27 @@ class SaveImageWithBase64:
 
 				# Composite the text image onto the background image using the rotated text mask       
 				img = Image.composite(text_image, back_image, rotated_text_mask)  
-			
-			metadata = PngInfo()
-			if prompt is not None:
-				metadata.add_text("prompt", json.dumps(prompt))
-			if extra_pnginfo is not None:
-				for x in extra_pnginfo:
-					metadata.add_text(x, json.dumps(extra_pnginfo[x]))
-			if latent is not None:
-				latent_base64 = convertlatent(latent)
-				metadata.add_text("latent_base64", latent_base64)
-			if positive_conditioning is not None:
-				p_conditioning_base64 = convertconditioning(positive_conditioning)
-				metadata.add_text("conditioning_base64", p_conditioning_base64)
-			if negative_conditioning is not None:
-				n_conditioning_base64 = convertconditioning(negative_conditioning)
-				metadata.add_text("conditioning_base64", n_conditioning_base64)
+
 			filename_with_batch_num = filename.replace("%batch_num%", str(batch_number))
-			file = f"{filename_with_batch_num}_{counter:05}_.png"
-			img.save(os.path.join(full_output_folder, file), pnginfo=metadata, compress_level=self.compress_level)
-			results.append({
+			file = f"{filename_with_batch_num}_{counter:05}_.{ext}"
+			with open(os.path.join(full_output_folder, file), "wb") as f:
+				f.write(encode_image(img, image_format, compress_level, text))
+			return {
 				"filename": file,
 				"subfolder": subfolder,
 				"type": self.type
-			})
-			counter += 1
+			}
+
+		results = parallel_map(save, [(b, image, counter + b) for b, image in enumerate(images)])
 		return { "ui": { "images": results } }
 
 
 class ExtractBase64FromImageUpload:
     @classmethod
     def INPUT_TYPES(s):
-        input_dir = folder_paths.get_input_directory()
-        files = [f for f in os.listdir(input_dir) if os.path.isfile(os.path.join(input_dir, f))]
+        files = list_files(folder_paths.get_input_directory())
         return {"required":
-                    {"image": (sorted(files), {"image_upload": True})},
+                    {"image": (files, {"image_upload": True})},
                 }
 
     RETURN_TYPES = ("STRING", "STRING")
@@ -565,25 +518,23 @@ class ExtractBase64FromImageUpload:
     def extract(self, image):
         image_path = folder_paths.get_annotated_filepath(image)
         img = Image.open(image_path)
+        info = get_text_metadata(img)
         
         latent_base64 = None
         conditioning_base64 = None
 
-        if "latent_base64" in img.info:
-            latent_base64 = img.info["latent_base64"]
+        if "latent_base64" in info:
+            latent_base64 = resolve_ref(info["latent_base64"])
         
-        if "conditioning_base64" in img.info:
-            conditioning_base64 = img.info["conditioning_base64"]
+        if "conditioning_base64" in info:
+            conditioning_base64 = resolve_ref(info["conditioning_base64"])
 
         return (latent_base64, conditioning_base64)
 
     @classmethod
     def IS_CHANGED(s, image):
         image_path = folder_paths.get_annotated_filepath(image)
-        m = hashlib.sha256()
-        with open(image_path, 'rb') as f:
-            m.update(f.read())
-        return m.digest().hex()
+        return file_digest(image_path)
 
 def tensor2pil(t_image: torch.Tensor)  -> Image:
     return Image.fromarray(np.clip(255.0 * t_image.cpu().numpy().squeeze(), 0, 255).astype(np.uint8))
@@ -610,8 +561,9 @@ class ExtractBase64FromImage:
         if hasattr(tensor, 'metadata'):
             metadata = tensor.metadata
             print("Metadata keys:", list(metadata.keys()))  # Print the metadata keys
-            latent_base64 = metadata.get("latent_base64", None)
-            conditioning_base64 = metadata.get("conditioning_base64", None)
+            # refs from FetchRemoteWithExtras are already resolved, these are local ones
+            latent_base64 = resolve_ref(metadata.get("latent_base64", None))
+            conditioning_base64 = resolve_ref(metadata.get("conditioning_base64", None))
 
         return (latent_base64, conditioning_base64)
 
@@ -1,6 +1,35 @@
-from ..core.fetch import fetch_from_remote, fetch_from_remote_with_extras
-from ..core.utils import clean_url, get_client_id, get_new_job_id
-from ..core.dispatch import dispatch_to_remote, clear_remote_queue
+import os
+import time
+import uuid
+import torch
+import comfy.utils
+import safetensors.torch
+from PIL import Image
+from io import BytesIO
+
+from ..core.fetch import fetch_remote_info, start_prefetch
+from ..core.utils import clean_url, get_client_id, get_new_job_id, evict_lru
+from ..core.dispatch import dispatch_cached, get_remote_info, TRIGGER_TOOLTIP
+from ..core.routes import TENSOR_SUBFOLDER, TENSOR_LIMIT, get_tensor_dir
+
+MAX_PREVIEW = 512 # largest side of relayed remote previews
+
+def remote_progress():
+	"""Show the remote job's progress/previews on the node that is currently waiting for it"""
+	pbar = comfy.utils.ProgressBar(1)
+	def progress(value, total, preview):
+		if preview is not None:
+			fmt, data = preview # re-encoded as JPEG for the local UI either way
+			try:
+				img = Image.open(BytesIO(data))
+				img.load()
+				preview = ("JPEG", img, MAX_PREVIEW)
+			except Exception as e:
+				# a broken preview shouldn't abort waiting for the result
+				print("NetDist: failed to decode remote preview:\n", e)
+				preview = None
+		pbar.update_absolute(value, total, preview)
+	return progress
 
 class FetchRemote():
 	"""
@@ -18,6 +47,10 @@ class FetchRemote():
 				"final_image": ("IMAGE",),
 				"remote_info": ("REMINFO",),
 			},
+			"optional": {
+				# tensor_* needs NetDist on the remote, falls back to png otherwise
+				"transfer": (["png", "tensor_fp32", "tensor_fp16"], {"default": "png"}),
+			},
 		}
 
 	RETURN_TYPES = ("IMAGE",)
@@ -25,15 +58,52 @@ class FetchRemote():
 	CATEGORY = "remote"
 	TITLE = "Fetch from remote"
 
-	def fetch(self, final_image, remote_info):
-		out = fetch_from_remote(
-			remote_url = remote_info.get("remote_url"),
-			job_id     = remote_info.get("job_id"),
-		)
+	def fetch(self, final_image, remote_info, transfer="png"):
+		out, _ = fetch_remote_info(remote_info, progress=remote_progress())
 		if out is None:
 			out = final_image[:1] * 0.0 # black image
 		return (out,)
 
+class NetDistTensorOutput():
+	"""
+	Replaces FetchRemote on the remote client when a tensor transfer is used.
+	Saves the final IMAGE batch as raw safetensors for /netdist/tensor.
+	"""
+	def __init__(self):
+		pass
+
+	@classmethod
+	def INPUT_TYPES(s):
+		return {
+			"required": {
+				"images": ("IMAGE",),
+				"precision": (["fp32", "fp16"], {"default": "fp32"}),
+			},
+		}
+
+	RETURN_TYPES = ()
+	OUTPUT_NODE = True
+	FUNCTION = "save"
+	CATEGORY = "remote"
+	TITLE = "Tensor output (NetDist)"
+
+	def save(self, images, precision):
+		dtype = torch.float16 if precision == "fp16" else torch.float32
+		filename = f"{uuid.uuid4().hex}.safetensors"
+		safetensors.torch.save_file(
+			{"images": images.to(dtype).contiguous().cpu()},
+			os.path.join(get_tensor_dir(), filename),
+		)
+		# not deleted once served, a cached prompt re-sends the same file name
+		evict_lru(get_tensor_dir(), TENSOR_LIMIT, keep=filename)
+		tensors = [{
+			"filename": filename,
+			"subfolder": TENSOR_SUBFOLDER,
+			"type": "temp",
+			"precision": precision,
+		}]
+		return {"ui": {"tensors": tensors}}
+
 #with extras returns, the image, remote latent and conditioning if there are any
 class FetchRemoteWithExtras():
     """
@@ -60,10 +130,7 @@ class FetchRemoteWithExtras():
     TITLE = "Fetch from remote"
 
     def fetch(self, final_image, remote_info):
-        out, metadata = fetch_from_remote_with_extras(
-            remote_url = remote_info.get("remote_url"),
-            job_id     = remote_info.get("job_id"),
-        )
+        out, metadata = fetch_remote_info(remote_info, progress=remote_progress(), extras=True)
         if out is None:
             out = final_image[:1] * 0.0 # black image
         
@@ -92,7 +159,7 @@ class RemoteQueueSimpleNux():
                 }),
                 "batch_local": ("INT", {"default": 1, "min": 1, "max": 8}),
                 "batch_remote": ("INT", {"default": 1, "min": 1, "max": 8}),
-                "trigger": (["on_change", "always"],),
+                "trigger": (["on_change", "always"], {"tooltip": TRIGGER_TOOLTIP}),
                 "enabled": (["true", "false", "remote"],{"default": "true"}),
                 "seed": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff}),
             },
@@ -141,7 +208,6 @@ class RemoteQueueSimpleNux():
         
         job_id = get_new_job_id()
         remote_url = clean_url(remote_url)
-        clear_remote_queue(remote_url)
         
         # Prepare remote parameters
         remote_params = []
@@ -153,11 +219,11 @@ class RemoteQueueSimpleNux():
                 if param and value:
                     remote_params.append((param, self.parse_value(value, value_type), nodetitle))
         
-        dispatch_to_remote(remote_url, prompt, job_id, remote_params)
-        remote_info = {
-            "remote_url" : remote_url,
-            "job_id"     : job_id,
-        }
+        # "always" means the remote has to run again, even for an unchanged prompt
+        prompt_id, cache_key = dispatch_cached(remote_url, prompt, job_id, remote_params, clear=True, reuse=trigger != "always")
+        if prompt_id is not None:
+            start_prefetch(remote_url, job_id, prompt_id)
+        remote_info = get_remote_info(remote_url, job_id, prompt_id, cache_key)
         return (seed, batch_local, remote_info)
 
     @classmethod
@@ -191,7 +257,7 @@ class RemoteQueueSimple():
                 }),
                 "batch_local": ("INT", {"default": 1, "min": 1, "max": 8}),
                 "batch_remote": ("INT", {"default": 1, "min": 1, "max": 8}),
-                "trigger": (["on_change", "always"],),
+                "trigger": (["on_change", "always"], {"tooltip": TRIGGER_TOOLTIP}),
                 "enabled": (["true", "false", "remote"],{"default": "true"}),
                 "seed": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff}),
             },
@@ -248,7 +314,6 @@ class RemoteQueueSimple():
         
         job_id = get_new_job_id()
         remote_url = clean_url(remote_url)
-        clear_remote_queue(remote_url)
         
         # Prepare remote parameters
         remote_params = []
@@ -261,11 +326,11 @@ class RemoteQueueSimple():
             if param and value:
                 remote_params.append((param, self.parse_value(value, value_type), nodetitle))
         
-        dispatch_to_remote(remote_url, prompt, job_id, remote_params)
-        remote_info = {
-            "remote_url" : remote_url,
-            "job_id"     : job_id,
-        }
+        # "always" means the remote has to run again, even for an unchanged prompt
+        prompt_id, cache_key = dispatch_cached(remote_url, prompt, job_id, remote_params, clear=True, reuse=trigger != "always")
+        if prompt_id is not None:
+            start_prefetch(remote_url, job_id, prompt_id)
+        remote_info = get_remote_info(remote_url, job_id, prompt_id, cache_key)
         return (seed, batch_local, remote_info)
 
     @classmethod
@@ -285,5 +350,6 @@ NODE_CLASS_MAPPINGS = {
     "RemoteQueueSimple(Nux)" : RemoteQueueSimpleNux,
 	"RemoteQueueSimple" : RemoteQueueSimple,
 	"FetchRemote"       : FetchRemote,
+	"NetDistTensorOutput" : NetDistTensorOutput,
     "FetchRemoteWithExtras(Nux)": FetchRemoteWithExtras,
 }
@@ -3,6 +3,14 @@ import json
 import hashlib
 import folder_paths
 
+from ..core.digest import file_digest
+from ..core.dirindex import list_files
+from ..core.jsoncache import load_cached
+
+def parse_json_file(path):
+	with open(path) as f:
+		return json.loads(f.read())
+
 class SaveDiskWorkflowJSON:
 	"""Save workflow to disk"""
 	def __init__(self):
@@ -38,11 +46,10 @@ class LoadDiskWorkflowJSON:
 
 	@classmethod
 	def INPUT_TYPES(s):
-		input_dir = folder_paths.get_input_directory()
-		files = [f for f in os.listdir(input_dir) if os.path.isfile(os.path.join(input_dir, f)) and f.endswith(".json")]
+		files = list_files(folder_paths.get_input_directory(), [".json"])
 		return {
 			"required": {
-				"workflow": [sorted(files),],
+				"workflow": [files,],
 			}
 		}
 
@@ -53,28 +60,23 @@ class LoadDiskWorkflowJSON:
 	TITLE = "Load workflow (disk)"
 
 	def load_workflow(self, workflow):
+		# parsed once per file version, shared with VALIDATE_INPUTS (read-only)
 		json_path = folder_paths.get_annotated_filepath(workflow)
-		with open(json_path) as f:
-			data = json.loads(f.read())
-		return (data,)
+		return (load_cached(json_path, parse_json_file),)
 
 	@classmethod
 	def IS_CHANGED(s, workflow):
 		json_path = folder_paths.get_annotated_filepath(workflow)
-		m = hashlib.sha256()
-		with open(json_path, 'rb') as f:
-			m.update(f.read())
-		return m.digest().hex()
+		return file_digest(json_path)
 
 	@classmethod
 	def VALIDATE_INPUTS(s, workflow):
 		if not folder_paths.exists_annotated_filepath(workflow):
 			return "Invalid JSON file: {}".format(workflow)
 		json_path = folder_paths.get_annotated_filepath(workflow)
-		with open(json_path) as f:
-			try: json.loads(f.read())
-			except:
-				return "Failed to read JSON file: {}".format(workflow)
+		try: load_cached(json_path, parse_json_file)
+		except:
+			return "Failed to read JSON file: {}".format(workflow)
 		return True
 
 class LoadCurrentWorkflowJSON:
@@ -112,6 +114,26 @@ from PIL import Image
 import piexif
 
 
+def parse_image_workflow(image_path):
+    with Image.open(image_path) as img:
+        # Try to get the EXIF data
+        exif_data = img.info.get("exif")
+        if not exif_data:
+            raise ValueError("No EXIF data found in the image")
+
+        exif_dict = piexif.load(exif_data)
+        user_comment = exif_dict.get("Exif", {}).get(piexif.ExifIFD.UserComment)
+        if not user_comment:
+            raise ValueError("No UserComment found in EXIF data")
+
+        metadata = json.loads(user_comment.decode("utf-8"))
+        workflow_json = metadata.get("prompt")
+        if not workflow_json:
+            raise ValueError("No 'prompt' field found in UserComment data")
+
+        # Parse the JSON string into a Python object
+        return json.loads(workflow_json)
+
 class LoadWorkflowJSON:
     """Load workflow JSON from disk or image upload"""
     def __init__(self):
@@ -119,11 +141,10 @@ class LoadWorkflowJSON:
 
     @classmethod
     def INPUT_TYPES(s):
-        input_dir = folder_paths.get_input_directory()
-        files = [f for f in os.listdir(input_dir) if os.path.isfile(os.path.join(input_dir, f)) and f.lower().endswith(('.png', '.jpg', '.jpeg', '.webp'))]
+        files = list_files(folder_paths.get_input_directory(), ['.png', '.jpg', '.jpeg', '.webp'])
         return {
             "required": {
-                "image": (sorted(files), {"image_upload": True}),
+                "image": (files, {"image_upload": True}),
             }
         }
 
@@ -139,25 +160,9 @@ class LoadWorkflowJSON:
             if not os.path.exists(image_path):
                 raise FileNotFoundError(f"Image file not found: {image_path}")
 
-            with Image.open(image_path) as img:
-                # Try to get the EXIF data
-                exif_data = img.info.get("exif")
-                if not exif_data:
-                    raise ValueError("No EXIF data found in the image")
-
-                exif_dict = piexif.load(exif_data)
-                user_comment = exif_dict.get("Exif", {}).get(piexif.ExifIFD.UserComment)
-                if not user_comment:
-                    raise ValueError("No UserComment found in EXIF data")
-
-                metadata = json.loads(user_comment.decode("utf-8"))
-                workflow_json = metadata.get("prompt")
-                if not workflow_json:
-                    raise ValueError("No 'prompt' field found in UserComment data")
-
-                # Parse the JSON string into a Python object
-                workflow_data = json.loads(workflow_json)
-                return (workflow_data,)
+            # parsed once per file version, shared with VALIDATE_INPUTS (read-only)
+            workflow_data = load_cached(image_path, parse_image_workflow)
+            return (workflow_data,)
 
         except Exception as e:
             print(f"Error loading workflow from image: {str(e)}")
@@ -170,10 +175,7 @@ class LoadWorkflowJSON:
             if not os.path.exists(image_path):
                 return "FILE_NOT_FOUND"
             
-            m = hashlib.sha256()
-            with open(image_path, 'rb') as f:
-                m.update(f.read())
-            return m.digest().hex()
+            return file_digest(image_path)
         except Exception as e:
             print(f"Error in IS_CHANGED: {str(e)}")
             return "ERROR"
@@ -185,19 +187,10 @@ class LoadWorkflowJSON:
             if not os.path.exists(image_path):
                 return f"Image file not found: {image_path}"
 
-            with Image.open(image_path) as img:
-                exif_data = img.info.get("exif")
-                if not exif_data:
-                    return f"No EXIF data found in image: {image}"
-
-                exif_dict = piexif.load(exif_data)
-                user_comment = exif_dict.get("Exif", {}).get(piexif.ExifIFD.UserComment)
-                if not user_comment:
-                    return f"No UserComment found in EXIF data: {image}"
-
-                metadata = json.loads(user_comment.decode("utf-8"))
-                if "prompt" not in metadata:
-                    return f"No 'prompt' field found in UserComment data: {image}"
+            try:
+                load_cached(image_path, parse_image_workflow)
+            except ValueError as e:
+                return f"{str(e)}: {image}"
 
             return True
         except Exception as e: